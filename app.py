@@ -4,11 +4,26 @@ import numpy as np
 import os
 import time
 import hashlib
-from io import BytesIO
-from datetime import date, datetime
-from sqlalchemy import create_engine, text
+import threading
+import uuid
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from sqlalchemy import text, Date, bindparam
 import plotly.express as px
 import plotly.graph_objects as go
+from exportacao import exportar, lotes_do_banco, lotes_do_dataframe, FORMATOS
+from perfil import PERFIL
+from importacao import ler_lotes, validar_lote, colunas_ausentes, modelo_csv, FORMATOS_IMPORTACAO, COLUNAS_OBRIGATORIAS
+from database import (
+    criar_engine, instrumentar_engine, conexao, garantir_schema, versao_schema, gravar_historico, METRICAS, OKRS
+)
+
+# Sessões compartilham o DataFrame do cache de clientes; com Copy-on-Write
+# cada sessão só copia os blocos que editar (padrão a partir do pandas 3)
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
 
 # ==========================================
 # 1. CONFIGURAÇÕES E CONSTANTES
@@ -59,6 +74,15 @@ CORES_PRAZO = {
     "Sem Prazo": "#BDC3C7"
 }
 
+# Paginação do Painel de Gestão (objetivos por página)
+OPCOES_POR_PAGINA = [5, 10, 20, 50]
+OBJETIVOS_POR_PAGINA = int(os.getenv("OKR_OBJETIVOS_POR_PAGINA", "10"))
+if OBJETIVOS_POR_PAGINA not in OPCOES_POR_PAGINA:
+    OPCOES_POR_PAGINA = sorted(OPCOES_POR_PAGINA + [OBJETIVOS_POR_PAGINA])
+
+# Usuários com acesso à página de administração (lista separada por vírgulas)
+ADMINS = {u.strip() for u in os.getenv("OKR_ADMINS", "").split(",") if u.strip()}
+
 # ==========================================
 # 2. CAMADA DE DADOS
 # ==========================================
@@ -70,31 +94,67 @@ def get_engine():
         db_url = db_url.replace("postgres://", "postgresql://", 1)
     
     if db_url:
-        return create_engine(db_url)
+        return criar_engine(db_url)
     try:
-        return st.connection("postgresql", type="sql").engine
+        return instrumentar_engine(st.connection("postgresql", type="sql").engine)
     except:
         st.error("Erro: Banco de dados não configurado.")
         st.stop()
 
 engine = get_engine()
 
+@st.cache_resource
+def preparar_schema():
+    """Cria/migra tabelas e índices uma vez por processo (desligável com OKR_AUTO_MIGRAR=0)"""
+    if os.getenv("OKR_AUTO_MIGRAR", "1") != "1":
+        return False
+    try:
+        garantir_schema(engine)
+        return True
+    except Exception as e:
+        st.warning(f"Não foi possível verificar o schema do banco: {e}")
+        return False
+
+preparar_schema()
+
+@st.cache_resource
+def historico_disponivel():
+    """O histórico de progresso depende da migração 3 (`python database.py migrar`)"""
+    try:
+        with conexao(engine) as conn:
+            return versao_schema(conn) >= 3
+    except Exception:
+        return False
+
+HISTORICO_ATIVO = historico_disponivel()
+
+# Colunas gravadas pelo app (id e created_at são gerados pelo banco, cliente vem da sessão)
+COLUNAS_PERSISTIDAS = ['departamento', 'objetivo', 'kr', 'tarefa', 'status',
+                       'responsavel', 'prazo', 'avanco', 'alvo', 'progresso_pct']
+
 def hash_password(password):
     return hashlib.sha256(str.encode(password)).hexdigest()
 
+@PERFIL.medir()
 def run_query(query, params=None, is_select=True):
     try:
-        with engine.connect() as conn:
-            if is_select:
-                return pd.read_sql(text(query) if isinstance(query, str) else query, conn, params=params)
-            else:
-                with conn.begin():
-                    conn.execute(text(query) if isinstance(query, str) else query, params or {})
-                return True
+        if is_select:
+            with conexao(engine) as conn:
+                df = pd.read_sql(text(query) if isinstance(query, str) else query, conn, params=params)
+            METRICAS.registrar_linhas(len(df))
+            return df
+        else:
+            with conexao(engine, transacao=True) as conn:
+                conn.execute(text(query) if isinstance(query, str) else query, params or {})
+            return True
     except Exception as e:
         st.error(f"Erro no banco: {e}")
         return None
 
+class _FalhaConsulta(Exception):
+    """Levantada pelas funções com st.cache_data quando run_query falha (o erro já foi exibido):
+    com exceção o resultado não vai para o cache e a próxima execução consulta de novo"""
+
 def carregar_dados_cliente(cliente_nome):
     query = "SELECT * FROM okrs WHERE cliente = :cli ORDER BY id ASC"
     df = run_query(query, params={'cli': cliente_nome})
@@ -103,36 +163,569 @@ def carregar_dados_cliente(cliente_nome):
                    'responsavel', 'prazo', 'avanco', 'alvo', 'progresso_pct', 'cliente', 'created_at']
     
     if df is None or df.empty:
-        return pd.DataFrame(columns=colunas_base)
+        return compactar_df(pd.DataFrame(columns=colunas_base))
     
     # Ajuste de tipos
     if 'prazo' in df.columns:
         df['prazo'] = pd.to_datetime(df['prazo'], errors='coerce')
+    if 'created_at' in df.columns:
+        df['created_at'] = pd.to_datetime(df['created_at'], errors='coerce')
     
     for col in ['avanco', 'alvo', 'progresso_pct']:
         if col in df.columns:
             df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0.0)
     
+    return compactar_df(df)
+
+# Representação compacta em memória: textos repetidos como category, id em
+# 32 bits e sem a coluna 'cliente' (constante na sessão). Os valores float
+# (avanco, alvo, progresso_pct) ficam em 64 bits porque voltam ao banco.
+COLUNAS_CATEGORICAS = ['departamento', 'objetivo', 'kr', 'status', 'responsavel']
+
+def compactar_df(df):
+    df = df.drop(columns=['cliente'], errors='ignore')
+    if 'kr' in df.columns:
+        df['kr'] = df['kr'].fillna('')
+    for col in COLUNAS_CATEGORICAS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    if 'kr' in df.columns and '' not in df['kr'].cat.categories:
+        # '' marca linhas sem KR e é usado como valor de preenchimento
+        df['kr'] = df['kr'].cat.add_categories([''])
+    if 'id' in df.columns:
+        df['id'] = pd.to_numeric(df['id'], errors='coerce').astype('Int32')
+    return df
+
+def expandir_df(df, cliente=None):
+    """Volta para tipos simples (gravação, exportação e data_editor)"""
+    df = df.copy(deep=False)
+    for col in COLUNAS_CATEGORICAS:
+        if col in df.columns and isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(object)
+    if cliente is not None:
+        df['cliente'] = cliente
+    return df
+
+def incluir_categorias(df, col, valores):
+    """Acrescenta à coluna categórica (no próprio df) os valores que ainda não são categorias"""
+    if col not in df.columns or not isinstance(df[col].dtype, pd.CategoricalDtype):
+        return
+    novas = pd.Index(pd.Series(valores, dtype=object).dropna().unique()).difference(df[col].cat.categories)
+    if len(novas):
+        df[col] = df[col].cat.add_categories(novas)
+
+def atribuir(df, labels, col, valor):
+    """df.loc[labels, col] = valor, tratando categorias novas"""
+    incluir_categorias(df, col, [valor])
+    df.loc[labels, col] = valor
+
+def relatorio_memoria(df):
+    """Uso de memória por coluna do DataFrame da sessão"""
+    uso = df.memory_usage(deep=True, index=True)
+    return pd.DataFrame({
+        'coluna': uso.index,
+        'tipo': [str(df.index.dtype) if c == 'Index' else str(df[c].dtype) for c in uso.index],
+        'kb': (uso.to_numpy() / 1024).round(1),
+    })
+
+# Cache de processo compartilhado entre sessões (uma cópia por cliente)
+class CacheClientes:
+    """Guarda o DataFrame de cada cliente com um número de versão e limite LRU.
+
+    As sessões recebem o frame compartilhado (somente leitura) e trabalham sobre
+    uma cópia rasa; `invalidar` incrementa a versão após cada gravação para que
+    as demais sessões recarreguem.
+    """
+
+    def __init__(self, max_clientes, max_bytes):
+        self.max_clientes = max_clientes
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._dados = OrderedDict()  # cliente -> (versao, df, bytes)
+        self._versoes = {}
+        self._carregando = {}
+
+    def versao(self, cliente):
+        with self._lock:
+            return self._versoes.get(cliente, 0)
+
+    def obter(self, cliente, carregar):
+        """Retorna (df, versao), carregando do banco uma única vez por versão"""
+        with self._lock:
+            item = self._dados.get(cliente)
+            if item is not None and item[0] == self._versoes.get(cliente, 0):
+                self._dados.move_to_end(cliente)
+                return item[1], item[0]
+            lock_cliente = self._carregando.setdefault(cliente, threading.Lock())
+
+        # Um único carregamento por cliente, mesmo com várias sessões abrindo juntas
+        with lock_cliente:
+            with self._lock:
+                versao = self._versoes.get(cliente, 0)
+                item = self._dados.get(cliente)
+                if item is not None and item[0] == versao:
+                    return item[1], item[0]
+            df = carregar(cliente)
+            # Frames vazios (cliente novo ou falha de leitura) não são guardados
+            if not df.empty:
+                tamanho = int(df.memory_usage(deep=True).sum())
+                with self._lock:
+                    if self._versoes.get(cliente, 0) == versao:
+                        self._dados[cliente] = (versao, df, tamanho)
+                        self._dados.move_to_end(cliente)
+                        self._evictar()
+            return df, versao
+
+    def invalidar(self, cliente):
+        """Incrementa a versão do cliente e descarta o frame em cache"""
+        with self._lock:
+            self._versoes[cliente] = self._versoes.get(cliente, 0) + 1
+            self._dados.pop(cliente, None)
+            return self._versoes[cliente]
+
+    def _evictar(self):
+        # Remove os clientes menos usados até respeitar os limites (mantém o mais recente)
+        total = sum(item[2] for item in self._dados.values())
+        while len(self._dados) > 1 and (len(self._dados) > self.max_clientes or total > self.max_bytes):
+            _, (_, _, tamanho) = self._dados.popitem(last=False)
+            total -= tamanho
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                'clientes': len(self._dados),
+                'bytes': sum(item[2] for item in self._dados.values()),
+                'versoes': dict(self._versoes),
+            }
+
+@st.cache_resource
+def get_cache_clientes():
+    return CacheClientes(
+        max_clientes=int(os.getenv("OKR_CACHE_MAX_CLIENTES", "32")),
+        max_bytes=int(os.getenv("OKR_CACHE_MAX_MB", "512")) * 1024 * 1024,
+    )
+
+def calcular_diff(df, snapshot):
+    """Compara o estado em memória com o snapshot carregado e separa inserções, atualizações e remoções por id"""
+    atual = _normalizar_para_diff(df)
+    base = _normalizar_para_diff(snapshot)
+
+    novos = atual[atual['id'].isna()]
+    com_id = atual[atual['id'].notna()].drop_duplicates('id')
+    ids_base = base['id'].dropna()
+    removidos = ids_base[~ids_base.isin(com_id['id'])].astype(int).tolist()
+
+    # Compara coluna a coluna apenas as linhas que continuam existindo
+    a = com_id.set_index('id')
+    b = base.dropna(subset=['id']).drop_duplicates('id').set_index('id').reindex(a.index)
+    diferente = pd.Series(False, index=a.index)
+    for col in COLUNAS_PERSISTIDAS:
+        iguais = (a[col] == b[col]).fillna(False).astype(bool) | (a[col].isna() & b[col].isna())
+        diferente |= ~iguais
+    alterados = com_id[diferente.to_numpy()]
+
+    return novos, alterados, removidos
+
+def _normalizar_para_diff(df):
+    df_n = expandir_df(df.reindex(columns=['id'] + COLUNAS_PERSISTIDAS))
+    df_n['id'] = pd.to_numeric(df_n['id'], errors='coerce')
+    df_n['prazo'] = pd.to_datetime(df_n['prazo'], errors='coerce')
+    for col in ['avanco', 'alvo', 'progresso_pct']:
+        df_n[col] = pd.to_numeric(df_n[col], errors='coerce')
+    return df_n
+
+def _registros_para_banco(df_rows, cliente_nome):
+    """Converte linhas do DataFrame em dicts com tipos nativos (NaN/NaT viram NULL)"""
+    df_rec = df_rows[COLUNAS_PERSISTIDAS].copy()
+    df_rec['prazo'] = df_rec['prazo'].dt.date
+    df_rec = df_rec.astype(object).where(df_rec.notna(), None)
+    registros = df_rec.to_dict('records')
+    for r in registros:
+        r['cliente'] = cliente_nome
+    return registros
+
+def preencher_ids(df, snapshot):
+    """Copia para df os ids que o snapshot já conhece (mesmo rótulo de linha).
+
+    Acontece quando um salvamento em segundo plano terminou depois que a
+    sessão já tinha feito novas edições sobre as linhas recém-inseridas.
+    """
+    if 'id' not in snapshot.columns:
+        return df
+    if 'id' not in df.columns:
+        df = df.assign(id=pd.array([pd.NA] * len(df), dtype='Int32'))
+    faltando = df.index[df['id'].isna().to_numpy()].intersection(snapshot.index[snapshot['id'].notna().to_numpy()])
+    if len(faltando):
+        df = df.copy(deep=False)
+        df.loc[faltando, 'id'] = snapshot.loc[faltando, 'id'].astype(df['id'].dtype)
     return df
 
-def salvar_dados_batch(df, cliente_nome):
-    """Salva os dados da memória no banco"""
+@PERFIL.medir()
+def persistir_diff(df, cliente_nome, snapshot):
+    """Grava o diff entre df e snapshot numa única transação (sem chamadas de UI; levanta exceção em erro)"""
+    df = preencher_ids(df, snapshot)
+    novos, alterados, removidos = calcular_diff(df, snapshot)
+
+    novos_ids = pd.Series(dtype='Int64')
+    novos_created = pd.Series(dtype='datetime64[ns]')
+    with conexao(engine, transacao=True) as conn:
+        if removidos:
+            conn.execute(
+                OKRS.delete().where(OKRS.c.cliente == cliente_nome, OKRS.c.id.in_(removidos))
+            )
+        if not alterados.empty:
+            registros = _registros_para_banco(alterados, cliente_nome)
+            for r, id_ in zip(registros, alterados['id'].astype(int)):
+                r['_id'] = id_
+            stmt = (
+                OKRS.update()
+                .where(OKRS.c.id == bindparam('_id'), OKRS.c.cliente == bindparam('_cli'))
+                .values({c: bindparam(f'v_{c}') for c in COLUNAS_PERSISTIDAS})
+            )
+            conn.execute(stmt, [
+                {'_id': r['_id'], '_cli': cliente_nome, **{f'v_{c}': r[c] for c in COLUNAS_PERSISTIDAS}}
+                for r in registros
+            ])
+        if not novos.empty:
+            res = conn.execute(
+                OKRS.insert().returning(OKRS.c.id, OKRS.c.created_at, sort_by_parameter_order=True),
+                _registros_para_banco(novos, cliente_nome)
+            ).all()
+            novos_ids = pd.Series([r[0] for r in res], index=novos.index, dtype='Int64')
+            novos_created = pd.Series(pd.to_datetime([r[1] for r in res]), index=novos.index)
+
+        if HISTORICO_ATIVO:
+            eventos = eventos_historico(novos, novos_ids, alterados, removidos, snapshot)
+            if eventos:
+                gravar_historico(conn, cliente_nome, eventos, fotografia_diaria(df), date.today())
+
+    return {
+        'inseridos': len(novos), 'atualizados': len(alterados), 'removidos': len(removidos),
+        'novos_ids': novos_ids, 'novos_created_at': novos_created,
+    }
+
+# Histórico de progresso (gravado junto com o salvamento)
+COLUNAS_HISTORICO = ['departamento', 'objetivo', 'kr', 'status', 'avanco', 'progresso_pct']
+
+def _registros_historico(df_rows, evento, ids):
+    valores = df_rows[COLUNAS_HISTORICO].astype(object)
+    registros = valores.where(valores.notna(), None).to_dict('records')
+    for r, id_ in zip(registros, ids):
+        r.update(okr_id=int(id_), evento=evento)
+    return registros
+
+def eventos_historico(novos, novos_ids, alterados, removidos, snapshot):
+    """Eventos do salvamento: inserções, remoções e alterações de avanço, progresso ou status"""
+    eventos = _registros_historico(novos, 'insercao', novos_ids) if not novos.empty else []
+    if alterados.empty and not removidos:
+        return eventos
+
+    ids = set(alterados['id'].astype(int)) | set(removidos)
+    base = _normalizar_para_diff(snapshot[snapshot['id'].isin(ids).fillna(False).to_numpy()])
+    base = base.drop_duplicates('id').set_index('id')
+    if not alterados.empty:
+        a = alterados.set_index('id')
+        b = base.reindex(a.index)
+        mudou = pd.Series(False, index=a.index)
+        for col in ['status', 'avanco', 'progresso_pct']:
+            mudou |= ~((a[col] == b[col]).fillna(False).astype(bool) | (a[col].isna() & b[col].isna()))
+        mudou = mudou.to_numpy()
+        eventos += _registros_historico(alterados[mudou], 'alteracao', alterados['id'][mudou])
+    if removidos:
+        r = base.reindex(pd.Index(removidos, dtype=base.index.dtype))
+        eventos += _registros_historico(r, 'remocao', r.index)
+    return eventos
+
+def fotografia_diaria(df):
+    """Acumulados do cliente por nível, a partir dos mesmos rollups do painel"""
+    r = Rollups(df, date.today())
+
+    def linha(nivel, acc, depto=None, obj=None, kr=None):
+        chaves = {c: None if v is None or pd.isna(v) else v
+                  for c, v in (('departamento', depto), ('objetivo', obj), ('kr', kr))}
+        return {'nivel': nivel, **chaves, 'soma_progresso': float(acc[0]), 'qtd': int(acc[1]),
+                'concluidos': int(acc[2]), 'atrasados': int(acc[3])}
+
+    linhas = [linha('cliente', r.total)] if r.total[1] else []
+    linhas += [linha('departamento', acc, d) for d, acc in r.departamentos.items()]
+    linhas += [linha('objetivo', acc, d, o) for (d, o), acc in r.objetivos.items()]
+    linhas += [linha('kr', acc, d, o, k) for (d, o, k), acc in r.krs.items()]
+    return linhas
+
+def aplicar_ids(df, relatorio):
+    """Escreve em df (in place) os ids e created_at gerados para as linhas inseridas"""
+    if relatorio['novos_ids'].empty:
+        return
+    # Sem a coluna id as linhas voltariam a ser inseridas a cada salvamento
+    if 'id' not in df.columns:
+        df['id'] = pd.array([pd.NA] * len(df), dtype='Int32')
+    if 'created_at' not in df.columns:
+        df['created_at'] = pd.Series(pd.NaT, index=df.index, dtype='datetime64[ns]')
+    labels = relatorio['novos_ids'].index.intersection(df.index)
+    df.loc[labels, 'id'] = relatorio['novos_ids'].loc[labels].astype(df['id'].dtype)
+    df.loc[labels, 'created_at'] = relatorio['novos_created_at'].loc[labels]
+
+@PERFIL.medir()
+def salvar_dados_batch(df, cliente_nome, snapshot=None):
+    """Salva no banco apenas as linhas inseridas, alteradas e removidas desde o snapshot.
+
+    Retorna um relatório com as contagens e os ids gerados para as linhas novas
+    (indexados pelo rótulo da linha em `df`), ou None em caso de erro.
+    """
     try:
-        df_save = df.copy()
-        # Remove colunas que não existem na tabela física ou que são geradas pelo banco
-        cols_to_drop = ['classificacao_prazo', 'mes_ano', 'id', 'created_at']
-        df_save = df_save.drop(columns=[c for c in cols_to_drop if c in df_save.columns])
-        
-        # Garante integridade
-        df_save['cliente'] = cliente_nome
-        
-        with engine.begin() as conn:
-            conn.execute(text("DELETE FROM okrs WHERE cliente = :cli"), {"cli": cliente_nome})
-            df_save.to_sql('okrs', conn, if_exists='append', index=False)
-        return True
+        if snapshot is None:
+            snapshot = carregar_dados_cliente(cliente_nome)
+        relatorio = persistir_diff(df, cliente_nome, snapshot)
+        # Outras sessões do mesmo cliente passam a recarregar os dados
+        relatorio['versao'] = get_cache_clientes().invalidar(cliente_nome)
+        return relatorio
     except Exception as e:
         st.error(f"Erro ao salvar: {e}")
-        return False
+        return None
+
+def aplicar_resultado_save(relatorio):
+    """Grava na sessão os ids gerados pelo banco e renova o snapshot usado no próximo diff"""
+    df = st.session_state.df_master
+    aplicar_ids(df, relatorio)
+    st.session_state.df_snapshot = df.copy(deep=False)
+    st.session_state.tenant_versao = relatorio['versao']
+    st.session_state.ultimo_save = {k: relatorio[k] for k in ['inseridos', 'atualizados', 'removidos']}
+
+# Importação em lote (planilha no layout da exportação)
+MAX_ERROS_IMPORTACAO = 1000
+
+class _ImportacaoCancelada(Exception):
+    pass
+
+def importar_okrs(arquivo, formato, cliente_nome, gravar=True, tudo_ou_nada=True):
+    """Lê o arquivo em lotes, valida e insere as linhas válidas numa única transação.
+
+    Com `gravar=False` apenas valida. Com `tudo_ou_nada`, qualquer erro desfaz a
+    importação inteira. Guarda no máximo MAX_ERROS_IMPORTACAO erros (a contagem é total).
+    """
+    departamentos = get_departamentos(cliente_nome)
+    relatorio = {'lidas': 0, 'validas': 0, 'inseridas': 0, 'linhas_com_erro': 0, 'total_erros': 0, 'cancelada': False}
+    erros = []
+    try:
+        with conexao(engine, transacao=True) as conn:
+            inicio = 0
+            for lote in ler_lotes(arquivo, formato):
+                if inicio == 0 and colunas_ausentes(lote):
+                    raise ValueError(f"Colunas obrigatórias ausentes: {', '.join(colunas_ausentes(lote))} "
+                                     f"(esperado: {', '.join(COLUNAS_OBRIGATORIAS)})")
+                validas, erros_lote = validar_lote(lote, inicio, list(CORES_STATUS), departamentos)
+                inicio += len(lote)
+                relatorio['lidas'] += len(validas) + erros_lote['linha'].nunique()
+                relatorio['validas'] += len(validas)
+                relatorio['linhas_com_erro'] += erros_lote['linha'].nunique()
+                relatorio['total_erros'] += len(erros_lote)
+                if sum(len(e) for e in erros) < MAX_ERROS_IMPORTACAO and not erros_lote.empty:
+                    erros.append(erros_lote)
+                if gravar and not validas.empty:
+                    validas['progresso_pct'] = calcular_progresso_vetorizado(validas)
+                    conn.execute(OKRS.insert(), _registros_para_banco(validas, cliente_nome))
+                    relatorio['inseridas'] += len(validas)
+            if gravar and tudo_ou_nada and relatorio['total_erros']:
+                raise _ImportacaoCancelada()
+    except _ImportacaoCancelada:
+        relatorio['inseridas'], relatorio['cancelada'] = 0, True
+
+    relatorio['erros'] = (pd.concat(erros, ignore_index=True).head(MAX_ERROS_IMPORTACAO) if erros
+                          else pd.DataFrame(columns=['linha', 'coluna', 'valor', 'erro']))
+    if relatorio['inseridas']:
+        relatorio['versao'] = get_cache_clientes().invalidar(cliente_nome)
+    return relatorio
+
+# Salvamento automático em segundo plano (write-behind)
+class FilaAutosave:
+    """Grava as edições de cada sessão numa thread pool, agrupando rajadas de edição.
+
+    Cada `enfileirar` substitui o frame pendente da sessão (o frame inteiro é o
+    estado, então a última versão basta) e reinicia a janela de debounce. Ao
+    expirar, o diff contra a última base gravada vai para o banco; gravações do
+    mesmo cliente nunca rodam em paralelo.
+
+    A entrada da sessão (que guarda a base, um frame do cliente inteiro) sai da
+    fila quando os resultados são coletados sem nada pendente, ou após `ttl`
+    segundos sem atividade (aba fechada sem "Sair").
+    """
+
+    def __init__(self, cache, debounce, max_workers, ttl=1800):
+        self.cache = cache
+        self.debounce = debounce
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="autosave")
+        self._lock = threading.Lock()
+        self._sessoes = {}
+        self._locks_cliente = {}
+
+    def _estado(self, sessao):
+        return self._sessoes.setdefault(sessao, {
+            'cliente': None, 'base': None, 'pendente': None, 'versao_pendente': None,
+            'status': 'ocioso', 'erro': None, 'quando': None, 'em_voo': None,
+            'timer': None, 'resultados': [], 'atividade': time.monotonic(),
+        })
+
+    def _tocar(self, sessao):
+        """Entrada da sessão (sem criar), marcando atividade"""
+        e = self._sessoes.get(sessao)
+        if e is not None:
+            e['atividade'] = time.monotonic()
+        return e
+
+    def _expirar(self):
+        # Sessões que pararam de rodar (a sessão ativa consulta o status a cada rerun)
+        limite = time.monotonic() - self.ttl
+        for sessao in [s for s, e in self._sessoes.items() if e['em_voo'] is None and e['atividade'] < limite]:
+            self._descartar(sessao)
+
+    def _descartar(self, sessao):
+        e = self._sessoes.pop(sessao, None)
+        if e and e['timer'] is not None:
+            e['timer'].cancel()
+
+    def enfileirar(self, sessao, cliente, df, versao_df, base):
+        with self._lock:
+            self._expirar()
+            e = self._estado(sessao)
+            e['atividade'] = time.monotonic()
+            e['cliente'] = cliente
+            if e['base'] is None:
+                e['base'] = base
+            # Cópia rasa: com Copy-on-Write as edições seguintes da sessão não a alteram
+            e['pendente'], e['versao_pendente'] = df.copy(deep=False), versao_df
+            if e['em_voo'] is None:
+                e['status'], e['erro'] = 'na fila', None
+            self._agendar(sessao, e, self.debounce)
+
+    def _agendar(self, sessao, e, atraso):
+        if e['timer'] is not None:
+            e['timer'].cancel()
+        e['timer'] = threading.Timer(atraso, self._disparar, (sessao,))
+        e['timer'].daemon = True
+        e['timer'].start()
+
+    def _disparar(self, sessao):
+        with self._lock:
+            e = self._sessoes.get(sessao)
+            # Se já há gravação em andamento, ela reagenda o pendente ao terminar
+            if e is None or e['pendente'] is None or e['em_voo'] is not None:
+                return
+            df, versao_df = e['pendente'], e['versao_pendente']
+            e['pendente'] = None
+            e['status'] = 'gravando'
+            e['em_voo'] = self._executor.submit(self._gravar, sessao, e['cliente'], df, versao_df, e['base'])
+
+    def _gravar(self, sessao, cliente, df, versao_df, base):
+        with self._lock:
+            lock_cliente = self._locks_cliente.setdefault(cliente, threading.Lock())
+        try:
+            with lock_cliente, PERFIL.execucao("autosave"):
+                df = preencher_ids(df, base)
+                relatorio = persistir_diff(df, cliente, base)
+                relatorio['versao'] = self.cache.invalidar(cliente)
+            nova_base = df.copy(deep=False)
+            aplicar_ids(nova_base, relatorio)
+            relatorio.update({'versao_df': versao_df, 'base': nova_base, 'quando': datetime.now()})
+            with self._lock:
+                # Sessão removida durante a gravação (logout ou recarga): não há a quem entregar
+                e = self._tocar(sessao)
+                if e is None:
+                    return
+                e['base'] = nova_base
+                e['resultados'].append(relatorio)
+                e['status'], e['erro'], e['quando'] = 'gravado', None, datetime.now()
+        except Exception as ex:
+            with self._lock:
+                e = self._tocar(sessao)
+                if e is None:
+                    return
+                e['status'], e['erro'] = 'erro', str(ex)
+                # Mantém o frame para nova tentativa (a menos que já exista um mais novo)
+                if e['pendente'] is None:
+                    e['pendente'], e['versao_pendente'] = df, versao_df
+        finally:
+            with self._lock:
+                e = self._sessoes.get(sessao)
+                if e is not None:
+                    e['em_voo'] = None
+                    if e['pendente'] is not None and e['status'] != 'erro':
+                        e['status'] = 'na fila'
+                        self._agendar(sessao, e, 0)
+
+    def tentar_novamente(self, sessao):
+        with self._lock:
+            e = self._tocar(sessao)
+            if e is not None and e['pendente'] is not None:
+                e['status'], e['erro'] = 'na fila', None
+                self._agendar(sessao, e, 0)
+
+    def status(self, sessao):
+        with self._lock:
+            e = self._tocar(sessao)
+            if e is None:
+                return {'status': 'ocioso', 'erro': None, 'quando': None, 'pendente': False, 'em_voo': False}
+            return {k: e[k] for k in ('status', 'erro', 'quando')} | {
+                'pendente': e['pendente'] is not None, 'em_voo': e['em_voo'] is not None
+            }
+
+    def coletar(self, sessao):
+        """Retorna (e remove) os relatórios de gravações concluídas desde a última coleta"""
+        with self._lock:
+            self._expirar()
+            e = self._tocar(sessao)
+            if e is None:
+                return []
+            resultados, e['resultados'] = e['resultados'], []
+            # Nada pendente: a base gravada passa a viver só na sessão (df_snapshot)
+            if e['pendente'] is None and e['em_voo'] is None and e['status'] != 'erro':
+                self._descartar(sessao)
+            return resultados
+
+    def descarregar(self, sessao, timeout=30):
+        """Grava imediatamente o que estiver pendente e espera terminar (usado no logout).
+
+        Uma gravação que falhou é tentada de novo uma vez. Retorna o status final:
+        quem chama deve conferir 'erro', 'pendente' e 'em_voo' antes de descartar a sessão.
+        """
+        limite = time.monotonic() + timeout
+        repetiu = False
+        while time.monotonic() < limite:
+            with self._lock:
+                e = self._sessoes.get(sessao)
+                if e is None:
+                    break
+                if e['status'] == 'erro':
+                    if repetiu or e['pendente'] is None:
+                        break
+                    repetiu = True
+                    e['status'], e['erro'] = 'na fila', None
+                if e['timer'] is not None:
+                    e['timer'].cancel()
+                futuro, pendente = e['em_voo'], e['pendente'] is not None
+            if futuro is not None:
+                try:
+                    futuro.result(timeout=max(0.0, limite - time.monotonic()))
+                except TimeoutError:
+                    break
+            elif pendente:
+                self._disparar(sessao)
+            else:
+                break
+        return self.status(sessao)
+
+    def remover(self, sessao):
+        with self._lock:
+            self._descartar(sessao)
+
+@st.cache_resource
+def get_fila_autosave():
+    return FilaAutosave(
+        get_cache_clientes(),
+        debounce=float(os.getenv("OKR_AUTOSAVE_DEBOUNCE", "3")),
+        max_workers=int(os.getenv("OKR_AUTOSAVE_WORKERS", "4")),
+        ttl=float(os.getenv("OKR_AUTOSAVE_TTL", "1800")),
+    )
 
 @st.cache_data(ttl=600)
 def get_departamentos(cliente_nome):
@@ -145,6 +738,7 @@ def calcular_progresso_vetorizado(df):
     alvo = df['alvo'].where(df['alvo'] != 0, 1)
     return (df['avanco'] / alvo).clip(0, 1)
 
+@PERFIL.medir()
 def classificar_prazo_vetorizado(df):
     if df.empty or 'prazo' not in df.columns: return pd.Series(dtype=str)
     hoje = pd.Timestamp(date.today())
@@ -164,6 +758,490 @@ def classificar_prazo_vetorizado(df):
         
     return classif
 
+# Agregações do Dashboard (mesmos números no banco e em memória)
+# Mesma regra de classificar_prazo_vetorizado, em SQL
+_SQL_OKRS_CLASSIFICADOS = """
+        SELECT cliente, departamento, status, COALESCE(progresso_pct, 0) AS progresso_pct,
+               CASE WHEN kr IS NOT NULL AND kr <> '' THEN 1 ELSE 0 END AS tem_kr,
+               CASE
+                   WHEN status = 'Concluído' THEN 'Concluído'
+                   WHEN prazo IS NULL THEN 'Sem Prazo'
+                   WHEN prazo < :hoje THEN 'Atrasado'
+                   WHEN prazo < :limite_urgente THEN 'Urgente (7 dias)'
+                   WHEN prazo < :limite_atencao THEN 'Atenção (30 dias)'
+                   ELSE 'No Prazo'
+               END AS classificacao_prazo
+        FROM okrs"""
+
+_PARAMETROS_PRAZO = (
+    bindparam('hoje', type_=Date), bindparam('limite_urgente', type_=Date), bindparam('limite_atencao', type_=Date)
+)
+
+def _parametros_prazo(hoje):
+    return {'hoje': hoje, 'limite_urgente': hoje + timedelta(days=8), 'limite_atencao': hoje + timedelta(days=31)}
+
+SQL_DASHBOARD = text(f"""
+    SELECT departamento, status, classificacao_prazo, tem_kr,
+           COUNT(*) AS qtd, SUM(progresso_pct) AS soma_progresso
+    FROM ({_SQL_OKRS_CLASSIFICADOS}
+        WHERE cliente = :cli
+    ) t
+    GROUP BY departamento, status, classificacao_prazo, tem_kr
+""").bindparams(*_PARAMETROS_PRAZO)
+
+# Carteira: as mesmas contagens para todos os clientes numa única varredura
+SQL_PORTFOLIO = text(f"""
+    SELECT cliente, status, classificacao_prazo, tem_kr,
+           COUNT(*) AS qtd, SUM(progresso_pct) AS soma_progresso
+    FROM ({_SQL_OKRS_CLASSIFICADOS}
+    ) t
+    GROUP BY cliente, status, classificacao_prazo, tem_kr
+""").bindparams(*_PARAMETROS_PRAZO)
+
+
+def resumir_dashboard(grupos):
+    """Deriva KPIs e quebras do Dashboard das contagens por (departamento, status, prazo, tem_kr)"""
+    krs = grupos[grupos['tem_kr'] == 1]
+    total = int(krs['qtd'].sum())
+    soma = float(krs['soma_progresso'].sum())
+    por_depto = krs.groupby('departamento')[['soma_progresso', 'qtd']].sum()
+    return {
+        'linhas': int(grupos['qtd'].sum()),
+        'total': total,
+        'progresso_medio': soma / total if total else 0.0,
+        'atrasados': int(krs.loc[krs['classificacao_prazo'] == "Atrasado", 'qtd'].sum()),
+        'concluidos': int(krs.loc[krs['status'] == "Concluído", 'qtd'].sum()),
+        'departamentos': pd.DataFrame({
+            'departamento': por_depto.index,
+            'progresso_pct': (por_depto['soma_progresso'] / por_depto['qtd']).to_numpy()
+        }),
+        'status': krs.groupby('status', as_index=False)['qtd'].sum(),
+        'prazos': krs.groupby('classificacao_prazo', as_index=False)['qtd'].sum(),
+    }
+
+def agregar_dashboard_memoria(df):
+    """Agrega o Dashboard do zero a partir de um DataFrame (a sessão usa os rollups incrementais)"""
+    return Rollups(df, date.today()).resumo()
+
+@st.cache_data(ttl=300, show_spinner=False)
+def carregar_dashboard_agregado(cliente_nome, hoje, versao=0):
+    """Agrega o Dashboard no banco (GROUP BY) sem trazer as tarefas para a memória"""
+    grupos = run_query(SQL_DASHBOARD, {'cli': cliente_nome, **_parametros_prazo(hoje)})
+    if grupos is None:
+        raise _FalhaConsulta()
+    grupos['soma_progresso'] = pd.to_numeric(grupos['soma_progresso'], errors='coerce').fillna(0.0)
+    return resumir_dashboard(grupos)
+
+# Pesos do índice de risco da carteira (0 a 100)
+PESOS_RISCO = {'atrasados': 0.5, 'urgentes': 0.2, 'falta_progresso': 0.3}
+
+def resumir_portfolio(grupos):
+    """KPIs do Dashboard por cliente (vetorizado) e índice de risco para o ranking"""
+    grupos = grupos.assign(
+        kr_qtd=grupos['qtd'].where(grupos['tem_kr'] == 1, 0),
+        kr_soma=grupos['soma_progresso'].where(grupos['tem_kr'] == 1, 0.0),
+    )
+    com_kr = grupos['tem_kr'] == 1
+    grupos['atrasados'] = grupos['kr_qtd'].where(com_kr & (grupos['classificacao_prazo'] == "Atrasado"), 0)
+    grupos['urgentes'] = grupos['kr_qtd'].where(com_kr & (grupos['classificacao_prazo'] == "Urgente (7 dias)"), 0)
+    grupos['concluidos'] = grupos['kr_qtd'].where(com_kr & (grupos['status'] == "Concluído"), 0)
+    carteira = grupos.groupby('cliente').agg(
+        linhas=('qtd', 'sum'), total=('kr_qtd', 'sum'), soma=('kr_soma', 'sum'),
+        atrasados=('atrasados', 'sum'), urgentes=('urgentes', 'sum'), concluidos=('concluidos', 'sum'),
+    )
+    total = carteira['total'].where(carteira['total'] > 0)
+    carteira['progresso_medio'] = (carteira['soma'] / total).fillna(0.0)
+    carteira['pct_atrasados'] = (carteira['atrasados'] / total).fillna(0.0)
+    carteira['risco'] = 100 * (
+        PESOS_RISCO['atrasados'] * carteira['pct_atrasados']
+        + PESOS_RISCO['urgentes'] * (carteira['urgentes'] / total).fillna(0.0)
+        + PESOS_RISCO['falta_progresso'] * (1 - carteira['progresso_medio'])
+    ).where(carteira['total'] > 0, 0.0)
+    return (carteira.drop(columns='soma').reset_index()
+            .sort_values(['risco', 'atrasados'], ascending=False, ignore_index=True))
+
+@st.cache_data(ttl=int(os.getenv("OKR_PORTFOLIO_TTL", "300")), show_spinner=False)
+def carregar_portfolio(hoje):
+    """Carteira de todos os clientes a partir de uma única consulta agrupada"""
+    grupos = run_query(SQL_PORTFOLIO, _parametros_prazo(hoje))
+    if grupos is None:
+        raise _FalhaConsulta()
+    grupos['soma_progresso'] = pd.to_numeric(grupos['soma_progresso'], errors='coerce').fillna(0.0)
+    return resumir_portfolio(grupos)
+
+# Evolução do progresso: uma consulta por faixa de datas no índice (cliente, nivel, dia)
+SQL_EVOLUCAO = text("""
+    SELECT dia, nivel, departamento, soma_progresso, qtd
+    FROM okrs_historico_diario
+    WHERE cliente = :cli AND nivel IN ('cliente', 'departamento') AND dia >= :inicio
+    ORDER BY dia
+""").bindparams(bindparam('inicio', type_=Date))
+
+@st.cache_data(ttl=300, show_spinner=False)
+def carregar_evolucao(cliente_nome, inicio, versao=0):
+    """Progresso médio por dia (geral e por departamento), dias sem salvamento repetem o último valor"""
+    linhas = run_query(SQL_EVOLUCAO, {'cli': cliente_nome, 'inicio': inicio})
+    if linhas is None:
+        raise _FalhaConsulta()
+    if linhas.empty:
+        return None
+    linhas['serie'] = linhas['departamento'].where(linhas['nivel'] == 'departamento', "Geral").fillna("(sem departamento)")
+    linhas['dia'] = pd.to_datetime(linhas['dia'])
+    linhas['progresso_pct'] = linhas['soma_progresso'] / linhas['qtd'].where(linhas['qtd'] > 0)
+    serie = linhas.pivot_table(index='dia', columns='serie', values='progresso_pct', aggfunc='last')
+    dias = pd.date_range(serie.index.min(), pd.Timestamp(date.today()), freq='D')
+    serie = serie.reindex(dias).ffill()
+    return serie.rename_axis('dia').reset_index().melt(id_vars='dia', var_name='serie', value_name='progresso_pct').dropna()
+
+# Índice hierárquico (departamento -> objetivo -> KR) reaproveitado entre reruns
+def construir_indice(df):
+    """Monta o índice hierárquico (rótulos por departamento -> objetivo -> KR) com um único groupby"""
+    indice = {'arvore': {}, 'objetivos': {}}
+    if df.empty:
+        return indice
+
+    kr = df['kr'].fillna('')
+    grupos = df.groupby([df['departamento'], df['objetivo'], kr], sort=True, dropna=False, observed=True)
+
+    for (depto, obj, k), pos in grupos.indices.items():
+        indice['arvore'].setdefault(depto, {}).setdefault(obj, {})[k] = df.index[pos]
+
+    # Rótulos de cada objetivo (união dos seus KRs) para renomear/excluir sem máscaras
+    for depto, objs in indice['arvore'].items():
+        for obj, krs in objs.items():
+            labels = list(krs.values())
+            indice['objetivos'][(depto, obj)] = labels[0].append(labels[1:])
+    return indice
+
+def obter_indice():
+    """Retorna o índice da versão atual de df_master, reconstruindo apenas quando os dados mudam"""
+    if st.session_state.get('indice_versao') != st.session_state.df_versao:
+        st.session_state.indice = construir_indice(st.session_state.df_master)
+        st.session_state.indice_versao = st.session_state.df_versao
+    return st.session_state.indice
+
+# Acumulados de progresso mantidos por delta
+class Rollups:
+    """Soma de progresso, quantidade, concluídas e atrasadas por KR, objetivo e departamento.
+
+    Só entram linhas com KR (mesma regra do Dashboard). As mutações removem as
+    linhas afetadas no estado anterior e somam as do novo estado, sem reprocessar
+    o frame. "Atrasado" depende do dia, então o motor é reconstruído na virada da data.
+    """
+
+    def __init__(self, df, dia):
+        self.dia = dia
+        self.linhas = 0
+        self.krs, self.objetivos, self.departamentos = {}, {}, {}
+        self.total = [0.0, 0, 0, 0]
+        self.por_status, self.por_prazo = {}, {}
+        self.adicionar(df)
+
+    def adicionar(self, df):
+        self._aplicar(df, 1)
+
+    def remover(self, df):
+        self._aplicar(df, -1)
+
+    def _aplicar(self, df, sinal):
+        if df is None or df.empty:
+            return
+        self.linhas += sinal * len(df)
+        kr = df['kr'].astype(object).fillna('')
+        com_kr = df[(kr != '').to_numpy()]
+        if com_kr.empty:
+            return
+        grupos = (
+            com_kr.assign(kr=kr[com_kr.index], classificacao_prazo=classificar_prazo_vetorizado(com_kr),
+                          progresso_pct=com_kr['progresso_pct'].fillna(0.0))
+            .groupby(['departamento', 'objetivo', 'kr', 'status', 'classificacao_prazo'], dropna=False, observed=True)
+            ['progresso_pct'].agg(['sum', 'size'])
+        )
+        for (depto, obj, k, status, prazo), soma, qtd in zip(grupos.index, grupos['sum'], grupos['size']):
+            delta = (sinal * soma, sinal * qtd,
+                     sinal * qtd if status == 'Concluído' else 0, sinal * qtd if prazo == 'Atrasado' else 0)
+            for mapa, chave in ((self.krs, (depto, obj, k)), (self.objetivos, (depto, obj)), (self.departamentos, depto)):
+                acc = mapa.setdefault(chave, [0.0, 0, 0, 0])
+                for i, v in enumerate(delta):
+                    acc[i] += v
+                if acc[1] == 0:
+                    del mapa[chave]
+            for i, v in enumerate(delta):
+                self.total[i] += v
+            for mapa, chave in ((self.por_status, status), (self.por_prazo, prazo)):
+                mapa[chave] = mapa.get(chave, 0) + delta[1]
+                if mapa[chave] == 0:
+                    del mapa[chave]
+
+    def progresso(self, depto, obj=None, kr=None):
+        """Média de progresso de um KR, objetivo ou departamento"""
+        return self._media(self.acumulado(depto, obj, kr))
+
+    def acumulado(self, depto, obj=None, kr=None):
+        """[soma_progresso, qtd, concluidas, atrasadas] do nível pedido"""
+        if kr is not None:
+            acc = self.krs.get((depto, obj, kr))
+        elif obj is not None:
+            acc = self.objetivos.get((depto, obj))
+        else:
+            acc = self.departamentos.get(depto)
+        return acc or [0.0, 0, 0, 0]
+
+    @staticmethod
+    def _media(acc):
+        return acc[0] / acc[1] if acc[1] else 0.0
+
+    def resumo(self):
+        """KPIs e quebras no mesmo formato de resumir_dashboard"""
+        # Como no GROUP BY do banco, departamento/status nulos ficam fora das quebras
+        deptos = sorted((d for d in self.departamentos if not pd.isna(d)), key=str)
+        status = [(s, q) for s, q in self.por_status.items() if not pd.isna(s)]
+        return {
+            'linhas': self.linhas,
+            'total': self.total[1],
+            'progresso_medio': self._media(self.total),
+            'atrasados': self.total[3],
+            'concluidos': self.total[2],
+            'departamentos': pd.DataFrame({
+                'departamento': deptos,
+                'progresso_pct': [self._media(self.departamentos[d]) for d in deptos],
+            }),
+            'status': pd.DataFrame(status, columns=['status', 'qtd']),
+            'prazos': pd.DataFrame(list(self.por_prazo.items()), columns=['classificacao_prazo', 'qtd']),
+        }
+
+def obter_rollups():
+    """Rollups da versão atual de df_master; só reconstrói quando uma mutação não enviou o delta ou o dia mudou"""
+    hoje = date.today()
+    if st.session_state.get('rollups_versao') != st.session_state.df_versao or st.session_state.rollups.dia != hoje:
+        st.session_state.rollups = Rollups(st.session_state.df_master, hoje)
+        st.session_state.rollups_versao = st.session_state.df_versao
+    return st.session_state.rollups
+
+# Busca de tarefas: índice invertido (token -> posições) e facetas, por versão dos dados
+COLUNAS_TEXTO_BUSCA = ['objetivo', 'kr', 'tarefa']
+
+def _normalizar_texto(serie):
+    """Minúsculas e sem acentos (ex.: "Relatório" casa com relatorio)"""
+    return serie.str.normalize('NFKD').str.encode('ascii', 'ignore').str.decode('ascii').str.lower()
+
+def construir_indice_busca(df, dia):
+    """Índice invertido sobre objetivo/KR/tarefa e facetas de responsável, status e prazo.
+
+    Os textos são tokenizados por valor distinto (objetivo e KR se repetem em
+    muitas linhas) e cada token aponta para as posições das linhas em `df`.
+    """
+    indice = {'labels': df.index, 'dia': dia, 'vocabulario': [], 'tokens': {}, 'facetas': {}}
+    if df.empty:
+        return indice
+
+    pares = []
+    for col in COLUNAS_TEXTO_BUSCA:
+        codigos, valores = pd.factorize(df[col].astype(object))
+        tokens = _normalizar_texto(pd.Series(valores, dtype=object).astype(str)).str.findall(r'\w+').explode().dropna()
+        por_codigo = pd.DataFrame({'codigo': tokens.index, 'token': tokens.to_numpy()})
+        linhas = pd.DataFrame({'codigo': codigos, 'pos': np.arange(len(df))})
+        pares.append(por_codigo.merge(linhas, on='codigo')[['token', 'pos']])
+    todos = pd.concat(pares, ignore_index=True)
+    posicoes = todos['pos'].to_numpy()
+    indice['tokens'] = {t: np.unique(posicoes[i]) for t, i in todos.groupby('token').indices.items()}
+    indice['vocabulario'] = sorted(indice['tokens'])
+
+    prazo = pd.Series(classificar_prazo_vetorizado(df).to_numpy())
+    indice['facetas'] = {
+        'responsavel': pd.Series(df['responsavel'].to_numpy()).groupby(df['responsavel'].to_numpy(), observed=True).indices,
+        'status': pd.Series(df['status'].to_numpy()).groupby(df['status'].to_numpy(), observed=True).indices,
+        'prazo': prazo.groupby(prazo.to_numpy()).indices,
+    }
+    return indice
+
+def obter_indice_busca():
+    """Índice de busca da versão atual de df_master (reconstruído quando os dados ou o dia mudam)"""
+    chave = (st.session_state.df_versao, date.today())
+    if st.session_state.get('indice_busca_versao') != chave:
+        st.session_state.indice_busca = construir_indice_busca(st.session_state.df_master, chave[1])
+        st.session_state.indice_busca_versao = chave
+    return st.session_state.indice_busca
+
+def buscar_tarefas(indice, texto='', responsaveis=(), status=(), prazos=()):
+    """Rótulos das tarefas que atendem a todos os filtros.
+
+    Cada termo do texto casa por prefixo com os tokens de objetivo/KR/tarefa;
+    dentro de uma faceta os valores são alternativos (OU).
+    """
+    vocabulario = indice['vocabulario']
+    selecao = None
+    # Máscaras booleanas: união e interseção em O(linhas), sem ordenar listas de posições
+    def restringir(listas):
+        nonlocal selecao
+        mascara = np.zeros(len(indice['labels']), dtype=bool)
+        for posicoes in listas:
+            mascara[posicoes] = True
+        selecao = mascara if selecao is None else selecao & mascara
+
+    for termo in _normalizar_texto(pd.Series([texto], dtype=object)).str.findall(r'\w+').iloc[0]:
+        inicio = bisect_left(vocabulario, termo)
+        fim = bisect_left(vocabulario, termo + '\x7f', lo=inicio)
+        restringir(indice['tokens'][t] for t in vocabulario[inicio:fim])
+    for faceta, valores in (('responsavel', responsaveis), ('status', status), ('prazo', prazos)):
+        if valores:
+            mapa = indice['facetas'][faceta]
+            restringir(mapa[v] for v in valores if v in mapa)
+    if selecao is None:
+        return indice['labels']
+    return indice['labels'][np.flatnonzero(selecao)]
+
+def anexar_linhas(linhas):
+    """Acrescenta linhas ao df_master com rótulos novos, sem renumerar as existentes"""
+    df = st.session_state.df_master
+    # Rótulos nunca são reaproveitados: o salvamento automático associa ids às linhas pelo rótulo
+    inicio = max(int(df.index.max()) + 1 if len(df) else 0, st.session_state.get('proximo_rotulo', 0))
+    st.session_state.proximo_rotulo = inicio + len(linhas)
+    novas = pd.DataFrame(linhas, index=pd.RangeIndex(inicio, inicio + len(linhas)))
+    if 'prazo' in novas.columns:
+        novas['prazo'] = pd.to_datetime(novas['prazo'], errors='coerce')
+    novas = compactar_df(novas)
+    # Mesmas colunas, ordem e tipos do df carregado (id e created_at ficam NA até o salvamento),
+    # inclusive quando ele ainda está vazio
+    ausentes = [c for c in df.columns if c not in novas.columns]
+    if ausentes:
+        novas = novas.join(df[ausentes].iloc[:0].reindex(novas.index))
+    novas = novas[list(df.columns) + [c for c in novas.columns if c not in df.columns]]
+    if len(df):
+        # Mesmas categorias dos dois lados para o concat manter o tipo category
+        for col in COLUNAS_CATEGORICAS:
+            if col in novas.columns and col in df.columns:
+                incluir_categorias(df, col, novas[col])
+                novas[col] = pd.Categorical(novas[col].astype(object), categories=df[col].cat.categories)
+        novas = pd.concat([df, novas])
+    st.session_state.df_master = novas
+    return novas.index[len(df):]
+
+def _valor_editor(col, valor):
+    # O data_editor devolve datas como texto ISO e números como JSON
+    if col == 'prazo':
+        return pd.to_datetime(valor, errors='coerce')
+    if col in ('avanco', 'alvo', 'progresso_pct'):
+        return pd.to_numeric(valor, errors='coerce')
+    return valor
+
+@PERFIL.medir()
+def aplicar_delta_editor(editor_key, labels, fixos=None):
+    """Callback de st.data_editor sobre linhas de df_master identificadas por rótulo.
+
+    A posição i do editor corresponde a labels[i]. Aplica só as linhas editadas,
+    adicionadas (com os padrões e os valores `fixos`) ou removidas e recalcula
+    o progresso apenas delas.
+    """
+    delta = st.session_state.get(editor_key) or {}
+    editadas = delta.get('edited_rows', {})
+    adicionadas = delta.get('added_rows', [])
+    removidas = [labels[int(p)] for p in delta.get('deleted_rows', [])]
+    if not (editadas or adicionadas or removidas):
+        return
+
+    df = st.session_state.df_master
+    antes = df.loc[labels]
+    for pos, mudancas in editadas.items():
+        label = labels[int(pos)]
+        for col, valor in mudancas.items():
+            valor = _valor_editor(col, valor)
+            incluir_categorias(df, col, [valor])
+            df.at[label, col] = valor
+
+    labels_kr = labels.difference(removidas, sort=False)
+    if adicionadas:
+        padrao = {
+            'tarefa': '', 'status': 'Não Iniciado', 'avanco': 0.0, 'alvo': 1.0,
+            'prazo': None, 'responsavel': st.session_state.user['name']
+        }
+        novas = []
+        for linha in adicionadas:
+            nova = {**padrao, **{c: _valor_editor(c, v) for c, v in linha.items() if v is not None}}
+            # Garante integridade
+            nova.update(fixos or {})
+            novas.append(nova)
+        labels_kr = labels_kr.append(anexar_linhas(novas))
+    if removidas:
+        st.session_state.df_master = st.session_state.df_master.drop(removidas)
+
+    # Recalcula o progresso apenas das linhas afetadas
+    df = st.session_state.df_master
+    df.loc[labels_kr, 'progresso_pct'] = calcular_progresso_vetorizado(df.loc[labels_kr])
+    marcar_alteracao(antes, df.loc[labels_kr])
+
+def aplicar_edicoes_kr(editor_key, labels, depto, obj, kr, cliente):
+    """Callback do editor de um KR: linhas novas herdam departamento, objetivo e KR"""
+    aplicar_delta_editor(editor_key, labels, {'departamento': depto, 'objetivo': obj, 'kr': kr, 'cliente': cliente})
+
+@PERFIL.medir()
+def garantir_dados_carregados():
+    """Carrega as tarefas do cliente do cache compartilhado quando necessário.
+
+    Recarrega também quando outra sessão gravou (versão nova) e esta não tem
+    alterações pendentes.
+    """
+    cache = get_cache_clientes()
+    cliente = st.session_state.user['cliente']
+    desatualizado = st.session_state.get('tenant_versao') != cache.versao(cliente)
+    if st.session_state.df_snapshot is None or (desatualizado and not st.session_state.needs_save):
+        df, versao = cache.obter(cliente, carregar_dados_cliente)
+        # O snapshot é o próprio frame compartilhado (nunca é alterado);
+        # a sessão edita uma cópia rasa que só copia o que for modificado
+        st.session_state.df_snapshot = df
+        st.session_state.df_master = df.copy(deep=False)
+        st.session_state.tenant_versao = versao
+        st.session_state.df_versao += 1
+        # A fila de salvamento automático passa a usar a nova base
+        if 'sessao_id' in st.session_state:
+            get_fila_autosave().remover(st.session_state.sessao_id)
+
+def _mesma_estrutura(antes, depois):
+    if antes is None or depois is None or not antes.index.equals(depois.index):
+        return False
+    return all(antes[c].astype(object).equals(depois[c].astype(object)) for c in ['departamento', 'objetivo', 'kr'])
+
+def marcar_alteracao(antes=None, depois=None):
+    """Sinaliza mudança em df_master: ativa o botão de salvar e invalida as estruturas derivadas.
+
+    Recebendo as linhas afetadas antes e depois da mudança, atualiza os rollups
+    por delta e mantém o índice quando a hierarquia não mudou.
+    """
+    versao = st.session_state.df_versao
+    st.session_state.needs_save = True
+    st.session_state.df_versao += 1
+    if antes is None and depois is None:
+        return
+    if st.session_state.get('rollups_versao') == versao and st.session_state.rollups.dia == date.today():
+        st.session_state.rollups.remover(antes)
+        st.session_state.rollups.adicionar(depois)
+        st.session_state.rollups_versao = st.session_state.df_versao
+    if st.session_state.get('indice_versao') == versao and _mesma_estrutura(antes, depois):
+        st.session_state.indice_versao = st.session_state.df_versao
+
+def enfileirar_autosave():
+    """Envia o estado atual da sessão para a fila, uma vez por versão de df_master"""
+    if not st.session_state.needs_save or st.session_state.get('autosave_versao') == st.session_state.df_versao:
+        return
+    get_fila_autosave().enfileirar(
+        st.session_state.sessao_id, st.session_state.user['cliente'], st.session_state.df_master,
+        st.session_state.df_versao, st.session_state.df_snapshot
+    )
+    st.session_state.autosave_versao = st.session_state.df_versao
+
+def aplicar_autosave():
+    """Incorpora na sessão as gravações concluídas em segundo plano; retorna quantas havia"""
+    resultados = get_fila_autosave().coletar(st.session_state.sessao_id)
+    for relatorio in resultados:
+        aplicar_ids(st.session_state.df_master, relatorio)
+        st.session_state.df_snapshot = relatorio['base']
+        st.session_state.tenant_versao = relatorio['versao']
+        st.session_state.ultimo_save = {k: relatorio[k] for k in ['inseridos', 'atualizados', 'removidos', 'quando']}
+        # Só limpa a pendência se nada mudou desde que esse estado foi enfileirado
+        if relatorio['versao_df'] == st.session_state.df_versao:
+            st.session_state.needs_save = False
+    return len(resultados)
+
 # ==========================================
 # 3. COMPONENTES DE UI
 # ==========================================
@@ -171,17 +1249,88 @@ def classificar_prazo_vetorizado(df):
 def render_metric_card(label, value, delta=None, delta_color="normal", help_text=None):
     st.metric(label=label, value=value, delta=delta, delta_color=delta_color, help=help_text)
 
-def converter_excel(df):
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df_exp = df.copy()
-        if 'prazo' in df_exp.columns:
-            df_exp['prazo'] = df_exp['prazo'].apply(lambda x: x.strftime('%d/%m/%Y') if pd.notnull(x) else '')
-        # Remove colunas técnicas da exportação
-        cols_remove = ['id', 'created_at']
-        df_exp = df_exp.drop(columns=[c for c in cols_remove if c in df_exp.columns])
-        df_exp.to_excel(writer, index=False)
-    return output.getvalue()
+def gerar_exportacao(formato, cliente=None, df=None):
+    """Conteúdo do arquivo exportado em bytes (o download_button não aceita o arquivo temporário)"""
+    lotes = lotes_do_dataframe(df) if df is not None else lotes_do_banco(engine, cliente)
+    with exportar(lotes, formato, cliente=cliente) as arquivo:
+        return arquivo.read()
+
+def render_exportacao(cliente=None, df=None, key="exportar"):
+    """Botão de download gerado sob demanda (só executa a exportação no clique)"""
+    c_fmt, c_btn = st.columns([1, 1])
+    formato = c_fmt.radio("Formato", list(FORMATOS), format_func=lambda f: FORMATOS[f][0],
+                          horizontal=True, key=f"{key}_formato", label_visibility="collapsed")
+
+    def gerar():
+        return gerar_exportacao(formato, cliente, df)
+
+    nome = (cliente or "todos_clientes").replace(" ", "_")
+    c_btn.download_button("⬇️ Exportar", gerar, file_name=f"okrs_{nome}_{date.today():%Y%m%d}.{formato}",
+                          mime=FORMATOS[formato][1], key=f"{key}_botao", use_container_width=True)
+
+def render_status_autosave():
+    """Situação do salvamento automático; roda como fragmento, atualizando sozinho enquanto há gravação"""
+    fila = get_fila_autosave()
+    sessao = st.session_state.sessao_id
+    if aplicar_autosave():
+        st.rerun()
+    estado = fila.status(sessao)
+    if estado['status'] == 'erro':
+        st.error(f"⚠️ Falha ao salvar: {estado['erro']}")
+        if st.button("🔁 Tentar novamente", use_container_width=True, key="autosave_retry"):
+            fila.tentar_novamente(sessao)
+            st.rerun(scope="fragment")
+    elif estado['em_voo']:
+        st.info("⏳ Salvando alterações...")
+    elif estado['pendente'] or st.session_state.needs_save:
+        st.info("🕒 Alterações na fila para salvar")
+    elif (st.session_state.ultimo_save or {}).get('quando'):
+        st.caption(f"✅ Salvo às {st.session_state.ultimo_save['quando']:%H:%M:%S}")
+
+def render_importacao(cliente):
+    """Upload de planilha: valida (simulação) ou importa as tarefas em lote"""
+    st.caption("Use o mesmo layout da exportação. As colunas cliente e progresso_pct são ignoradas "
+               "(o progresso é recalculado a partir de avanco/alvo).")
+    arquivo = st.file_uploader("Arquivo", type=list(FORMATOS_IMPORTACAO), key="arquivo_importacao",
+                               label_visibility="collapsed")
+    tudo_ou_nada = st.checkbox("Importar somente se nenhuma linha tiver erro", value=True, key="importacao_tudo_ou_nada")
+    c_val, c_imp, c_mod = st.columns(3)
+    validar = c_val.button("🔎 Validar", use_container_width=True, disabled=arquivo is None)
+    importar = c_imp.button("⬆️ Importar", type="primary", use_container_width=True, disabled=arquivo is None)
+    c_mod.download_button("📄 Modelo (CSV)", modelo_csv(), file_name="modelo_importacao_okrs.csv",
+                          mime="text/csv", use_container_width=True)
+
+    if (validar or importar) and arquivo is not None:
+        if importar and st.session_state.get('needs_save'):
+            st.warning("Salve as alterações pendentes antes de importar.")
+            return
+        formato = arquivo.name.rsplit('.', 1)[-1].lower()
+        try:
+            with st.spinner("Processando arquivo..."):
+                relatorio = importar_okrs(arquivo, formato, cliente, gravar=importar, tudo_ou_nada=tudo_ou_nada)
+        except Exception as e:
+            st.error(f"Não foi possível ler o arquivo: {e}")
+            return
+        st.session_state.resultado_importacao = {**relatorio, 'simulacao': not importar}
+        if relatorio['inseridas']:
+            # Recarrega o painel com as tarefas novas
+            st.rerun()
+
+    r = st.session_state.get('resultado_importacao')
+    if not r:
+        return
+    if r['simulacao']:
+        st.info(f"Validação: {r['validas']} de {r['lidas']} linhas válidas.")
+    elif r['cancelada']:
+        st.warning(f"Nada foi importado: {r['linhas_com_erro']} linha(s) com erro.")
+    else:
+        st.success(f"{r['inseridas']} tarefas importadas.")
+    if r['total_erros']:
+        st.caption(f"{r['total_erros']} erro(s) em {r['linhas_com_erro']} linha(s)"
+                   + (f"; exibindo os primeiros {len(r['erros'])}" if len(r['erros']) < r['total_erros'] else ""))
+        st.dataframe(r['erros'], use_container_width=True, hide_index=True)
+        st.download_button("⬇️ Erros (CSV)", r['erros'].to_csv(index=False).encode('utf-8-sig'),
+                           file_name="erros_importacao.csv", mime="text/csv")
 
 def show_login_page():
     col1, col2, col3 = st.columns([1, 1.5, 1])
@@ -200,7 +1349,9 @@ def show_login_page():
                     res = run_query("SELECT * FROM users WHERE username=:u AND password=:p", {'u': u, 'p': p})
                     if res is not None and not res.empty:
                         st.session_state.user = res.iloc[0].to_dict()
-                        st.session_state.df_master = carregar_dados_cliente(st.session_state.user['cliente'])
+                        st.session_state.sessao_id = uuid.uuid4().hex
+                        # As tarefas só são carregadas quando uma tela precisar delas
+                        st.session_state.df_snapshot = None
                         st.session_state.needs_save = False
                         st.rerun()
                     else:
@@ -226,46 +1377,126 @@ def show_login_page():
 # 4. DASHBOARD E PAINEL
 # ==========================================
 
-def render_dashboard(df):
-    if df.empty:
-        st.info("Sem dados para exibir.")
-        return
+def construir_figuras_dashboard(agregados):
+    """Figuras do Dashboard (como dicts do Plotly) montadas só com os agregados"""
+    fig_dept = px.bar(agregados['departamentos'], x='departamento', y='progresso_pct', color='progresso_pct',
+                      color_continuous_scale='Blues')
+    fig_dept.update_layout(yaxis_tickformat='.0%', height=300, margin=dict(t=10,b=10))
+
+    fig_status = px.pie(agregados['status'], names='status', values='qtd', color='status',
+                        color_discrete_map=CORES_STATUS, hole=0.4)
+    fig_status.update_layout(height=300, margin=dict(t=10,b=10))
+
+    fig_prazos = px.bar(agregados['prazos'], x='classificacao_prazo', y='qtd', color='classificacao_prazo',
+                        color_discrete_map=CORES_PRAZO, labels={'classificacao_prazo': '', 'qtd': 'KRs'})
+    fig_prazos.update_layout(height=250, margin=dict(t=10,b=10), showlegend=False)
+    return {'departamentos': fig_dept.to_dict(), 'status': fig_status.to_dict(), 'prazos': fig_prazos.to_dict()}
 
-    # Filtra apenas linhas válidas (com KR)
-    df_krs = df[df['kr'].notna() & (df['kr'] != '')].copy()
-    if df_krs.empty:
-        st.warning("Adicione KRs para ver os indicadores.")
+@st.cache_data(ttl=300, max_entries=256, show_spinner=False)
+def figuras_dashboard(chave, _agregados):
+    """Figuras memorizadas pela versão dos dados (`chave`); os agregados não entram no hash"""
+    return construir_figuras_dashboard(_agregados)
+
+def render_dashboard(df=None, cliente=None, rollups=None):
+    """Dashboard a partir dos rollups da sessão, de um DataFrame em memória ou agregado direto no banco (cliente)"""
+    hoje = date.today()
+    if rollups is not None:
+        agregados = rollups.resumo()
+        chave = ('sessao', st.session_state.get('sessao_id'), st.session_state.df_versao, hoje)
+    elif df is not None:
+        agregados, chave = agregar_dashboard_memoria(df), None
+    else:
+        versao = get_cache_clientes().versao(cliente)
+        try:
+            agregados = carregar_dashboard_agregado(cliente, hoje, versao)
+        except _FalhaConsulta:
+            return
+        chave = ('cliente', cliente, versao, hoje)
+
+    if agregados['total'] == 0:
+        if agregados['linhas'] == 0:
+            st.info("Sem dados para exibir.")
+        else:
+            st.warning("Adicione KRs para ver os indicadores.")
         return
 
-    df_krs['classificacao_prazo'] = classificar_prazo_vetorizado(df_krs)
-    
     # KPIs
     m1, m2, m3, m4 = st.columns(4)
-    with m1: render_metric_card("Total de KRs", len(df_krs))
-    with m2: render_metric_card("Progresso Médio", f"{df_krs['progresso_pct'].mean():.1%}")
+    with m1: render_metric_card("Total de KRs", agregados['total'])
+    with m2: render_metric_card("Progresso Médio", f"{agregados['progresso_medio']:.1%}")
     with m3:
-        atrasados = len(df_krs[df_krs['classificacao_prazo'] == "Atrasado"])
+        atrasados = agregados['atrasados']
         render_metric_card("Atrasados", atrasados, delta=-atrasados if atrasados > 0 else 0, delta_color="inverse")
     with m4:
-        concluidos = len(df_krs[df_krs['status'] == "Concluído"])
-        render_metric_card("Concluídos", concluidos)
+        render_metric_card("Concluídos", agregados['concluidos'])
 
     st.divider()
     
-    # Gráficos
+    # Gráficos (reconstruídos só quando a versão dos dados muda)
+    figuras = construir_figuras_dashboard(agregados) if chave is None else figuras_dashboard(chave, agregados)
     c1, c2 = st.columns(2)
     with c1:
         st.subheader("Progresso por Área")
-        df_dept = df_krs.groupby('departamento')['progresso_pct'].mean().reset_index()
-        fig = px.bar(df_dept, x='departamento', y='progresso_pct', color='progresso_pct', color_continuous_scale='Blues')
-        fig.update_layout(yaxis_tickformat='.0%', height=300, margin=dict(t=10,b=10))
-        st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(figuras['departamentos'], use_container_width=True, key="grafico_departamentos")
     
     with c2:
         st.subheader("Status Geral")
-        fig = px.pie(df_krs, names='status', color='status', color_discrete_map=CORES_STATUS, hole=0.4)
-        fig.update_layout(height=300, margin=dict(t=10,b=10))
-        st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(figuras['status'], use_container_width=True, key="grafico_status")
+
+    st.subheader("Situação dos Prazos")
+    st.plotly_chart(figuras['prazos'], use_container_width=True, key="grafico_prazos")
+
+    if cliente and HISTORICO_ATIVO:
+        render_evolucao(cliente)
+
+PERIODOS_EVOLUCAO = {"30 dias": 30, "Trimestre": 90, "Semestre": 182, "Ano": 365}
+
+@st.cache_data(ttl=300, show_spinner=False)
+def figura_evolucao(cliente_nome, inicio, versao=0):
+    evolucao = carregar_evolucao(cliente_nome, inicio, versao)
+    if evolucao is None:
+        return None
+    fig = px.line(evolucao, x='dia', y='progresso_pct', color='serie', labels={'dia': '', 'progresso_pct': 'Progresso', 'serie': ''})
+    fig.update_traces(selector=dict(name="Geral"), line=dict(width=4, color="#333"))
+    fig.update_layout(yaxis_tickformat='.0%', height=300, margin=dict(t=10,b=10))
+    return fig.to_dict()
+
+# Fragmento: trocar o período reexecuta só este gráfico, sem reenviar os demais
+@st.fragment
+def render_evolucao(cliente):
+    c_tit, c_per = st.columns([3, 2])
+    c_tit.subheader("Evolução do Progresso")
+    periodo = c_per.radio("Período", list(PERIODOS_EVOLUCAO), index=1, horizontal=True,
+                          key="periodo_evolucao", label_visibility="collapsed")
+    inicio = date.today() - timedelta(days=PERIODOS_EVOLUCAO[periodo])
+    try:
+        figura = figura_evolucao(cliente, inicio, get_cache_clientes().versao(cliente))
+    except _FalhaConsulta:
+        return
+    if figura is None:
+        st.caption("O histórico é registrado a cada salvamento; ainda não há pontos neste período.")
+        return
+    st.plotly_chart(figura, use_container_width=True, key="grafico_evolucao")
+
+def config_editor_tarefas(com_hierarquia=False):
+    """Colunas do editor de tarefas; com_hierarquia exibe departamento/objetivo/KR (somente leitura)"""
+    hierarquia = {
+        "departamento": st.column_config.TextColumn("Departamento", disabled=True),
+        "objetivo": st.column_config.TextColumn("Objetivo", disabled=True),
+        "kr": st.column_config.TextColumn("KR", disabled=True),
+    } if com_hierarquia else {"departamento": None, "objetivo": None, "kr": None}
+    return {
+        "tarefa": st.column_config.TextColumn("Tarefa", width="large", required=True),
+        "status": st.column_config.SelectboxColumn("Status", options=list(CORES_STATUS.keys()), required=True),
+        "avanco": st.column_config.NumberColumn("Real", min_value=0),
+        "alvo": st.column_config.NumberColumn("Meta", min_value=0.1),
+        "progresso_pct": st.column_config.ProgressColumn("%", format="%.0f%%", min_value=0, max_value=1),
+        "prazo": st.column_config.DateColumn("Prazo", format="DD/MM/YYYY"),
+        "responsavel": st.column_config.TextColumn("Resp."),
+        # Ocultar colunas técnicas
+        "id": None, "created_at": None, "cliente": None,
+        **hierarquia,
+    }
 
 def render_management_panel(df, cliente, depto_list):
     # Criação Rápida
@@ -280,142 +1511,354 @@ def render_management_panel(df, cliente, depto_list):
                     'status': 'Não Iniciado', 'avanco': 0.0, 'alvo': 1.0, 'progresso_pct': 0.0,
                     'prazo': date.today(), 'responsavel': st.session_state.user['name'], 'cliente': cliente
                 }
-                st.session_state.df_master = pd.concat([st.session_state.df_master, pd.DataFrame([new_row])], ignore_index=True)
-                st.session_state.needs_save = True
+                novas = anexar_linhas([new_row])
+                marcar_alteracao(depois=st.session_state.df_master.loc[novas])
                 st.rerun()
 
+    with st.expander("⬆️ Importar planilha", expanded=False):
+        render_importacao(cliente)
+
     if df.empty:
         st.info("Comece criando um objetivo acima.")
         return
 
-    # Estrutura Hierárquica
-    depts = sorted(df['departamento'].unique())
+    with st.expander("⬇️ Exportar dados", expanded=False):
+        # Com alterações pendentes exporta o que está na tela; senão lê direto do banco em lotes
+        render_exportacao(cliente, df if st.session_state.needs_save else None, key="exportar_painel")
+
+    # Estrutura Hierárquica (índice pré-computado por versão dos dados) e progresso acumulado
+    indice = obter_indice()
+    rollups = obter_rollups()
+    depts = list(indice['arvore'])
     if not depts: return
     
-    tabs = st.tabs(depts)
-    for i, depto in enumerate(depts):
-        with tabs[i]:
-            df_d = df[df['departamento'] == depto]
-            objs = sorted(df_d['objetivo'].unique())
-            
-            for obj in objs:
-                mask_obj = (df['departamento'] == depto) & (df['objetivo'] == obj)
-                df_obj = df[mask_obj]
+    # Renderização sob demanda: só a aba aberta é montada e cada objetivo
+    # só materializa seus KRs quando o expander é aberto
+    tabs = st.tabs(depts, key="tabs_depto", on_change="rerun")
+    with PERFIL.span("painel_gestao"):
+        for i, depto in enumerate(depts):
+            if tabs[i].open is False:
+                continue
+            with tabs[i]:
+                c_busca, c_tam, c_pag = st.columns([4, 1, 1])
+                busca = c_busca.text_input("Buscar objetivo", key=f"busca_{depto}", placeholder="🔎 Buscar objetivo...", label_visibility="collapsed")
+                por_pagina = c_tam.selectbox("Por página", OPCOES_POR_PAGINA, key=f"por_pagina_{depto}",
+                                             index=OPCOES_POR_PAGINA.index(OBJETIVOS_POR_PAGINA), label_visibility="collapsed",
+                                             format_func=lambda n: f"{n} por página")
+
+                objs = list(indice['arvore'][depto])
+                if busca:
+                    objs = [o for o in objs if busca.lower() in str(o).lower()]
+                if not objs:
+                    st.caption("Nenhum objetivo encontrado.")
+                    continue
+
+                n_paginas = -(-len(objs) // por_pagina)
+                pagina = c_pag.selectbox("Página", range(1, n_paginas + 1), key=f"pagina_{depto}_{busca}_{por_pagina}",
+                                         label_visibility="collapsed", format_func=lambda p: f"Página {p}/{n_paginas}")
+                inicio = (pagina - 1) * por_pagina
+                st.caption(f"Objetivos {inicio + 1}–{min(inicio + por_pagina, len(objs))} de {len(objs)}")
+
+                for obj in objs[inicio:inicio + por_pagina]:
+                    krs_obj = indice['arvore'][depto][obj]
+                    labels_obj = indice['objetivos'][(depto, obj)]
                 
-                # Progresso do Objetivo
-                valid_krs = df_obj[df_obj['kr'] != '']
-                prog = valid_krs['progresso_pct'].mean() if not valid_krs.empty else 0.0
+                    # Rótulo fixo: o ID do expander depende do rótulo, e um % no título o fecharia a cada edição
+                    exp = st.expander(f"🎯 {obj}", expanded=len(objs) == 1, key=f"exp_{depto}_{obj}", on_change="rerun")
+                    if exp.open is False:
+                        continue
                 
-                with st.expander(f"🎯 {obj} ({int(prog*100)}%)", expanded=True):
-                    # Edição do Objetivo
-                    c_edit, c_del = st.columns([5, 1])
-                    new_title = c_edit.text_input("Nome do Objetivo", value=obj, key=f"title_{depto}_{obj}", label_visibility="collapsed")
-                    if new_title != obj:
-                        st.session_state.df_master.loc[mask_obj, 'objetivo'] = new_title
-                        st.session_state.needs_save = True
-                        st.rerun()
+                    with exp:
+                        # Progresso do Objetivo
+                        soma, qtd, concluidas, atrasadas = rollups.acumulado(depto, obj)
+                        prog = soma / qtd if qtd else 0.0
+                        texto = f"Progresso do objetivo: {int(prog*100)}% · {concluidas}/{qtd} concluídas"
+                        st.progress(prog, text=texto + (f" · ⚠️ {atrasadas} atrasadas" if atrasadas else ""))
+
+                        # Edição do Objetivo
+                        c_edit, c_del = st.columns([5, 1])
+                        new_title = c_edit.text_input("Nome do Objetivo", value=obj, key=f"title_{depto}_{obj}", label_visibility="collapsed")
+                        if new_title != obj:
+                            antes = df.loc[labels_obj]
+                            atribuir(st.session_state.df_master, labels_obj, 'objetivo', new_title)
+                            marcar_alteracao(antes, st.session_state.df_master.loc[labels_obj])
+                            st.rerun()
                     
-                    if c_del.button("🗑️", key=f"del_{depto}_{obj}", help="Excluir Objetivo"):
-                        st.session_state.df_master = st.session_state.df_master[~mask_obj]
-                        st.session_state.needs_save = True
-                        st.rerun()
+                        if c_del.button("🗑️", key=f"del_{depto}_{obj}", help="Excluir Objetivo"):
+                            st.session_state.df_master = st.session_state.df_master.drop(labels_obj)
+                            marcar_alteracao(antes=df.loc[labels_obj])
+                            st.rerun()
 
-                    st.markdown("---")
+                        st.markdown("---")
                     
-                    # Loop de KRs
-                    krs = [k for k in df_obj['kr'].unique() if k]
-                    for kr in krs:
-                        mask_kr = mask_obj & (df['kr'] == kr)
-                        df_kr_tasks = df[mask_kr].copy()
+                        # Loop de KRs
+                        krs = [k for k in krs_obj if k]
+                        for kr in krs:
+                            labels_kr = krs_obj[kr]
+                            df_kr_tasks = df.loc[labels_kr]
                         
-                        # --- CABEÇALHO DO KR (Renomear e Excluir) ---
-                        c_kr_name, c_kr_del = st.columns([6, 0.5])
+                            # --- CABEÇALHO DO KR (Renomear e Excluir) ---
+                            c_kr_name, c_kr_del = st.columns([6, 0.5])
                         
-                        # Campo de texto para renomear KR
-                        new_kr_name = c_kr_name.text_input(
-                            "KR", 
-                            value=kr, 
-                            key=f"name_kr_{depto}_{obj}_{kr}", 
-                            label_visibility="collapsed",
-                            placeholder="Nome do Resultado Chave"
-                        )
+                            # Campo de texto para renomear KR
+                            new_kr_name = c_kr_name.text_input(
+                                "KR", 
+                                value=kr, 
+                                key=f"name_kr_{depto}_{obj}_{kr}", 
+                                label_visibility="collapsed",
+                                placeholder="Nome do Resultado Chave"
+                            )
                         
-                        # Lógica de Renomear KR
-                        if new_kr_name != kr:
-                            st.session_state.df_master.loc[mask_kr, 'kr'] = new_kr_name
-                            st.session_state.needs_save = True
-                            st.rerun() # Rerun necessário para atualizar estrutura
+                            # Lógica de Renomear KR
+                            if new_kr_name != kr:
+                                atribuir(st.session_state.df_master, labels_kr, 'kr', new_kr_name)
+                                marcar_alteracao(df_kr_tasks, st.session_state.df_master.loc[labels_kr])
+                                st.rerun() # Rerun necessário para atualizar estrutura
                             
-                        # Botão Excluir KR
-                        if c_kr_del.button("❌", key=f"del_kr_{depto}_{obj}_{kr}", help="Excluir este KR e suas tarefas"):
-                            st.session_state.df_master = st.session_state.df_master[~mask_kr]
-                            st.session_state.needs_save = True
+                            # Botão Excluir KR
+                            if c_kr_del.button("❌", key=f"del_kr_{depto}_{obj}_{kr}", help="Excluir este KR e suas tarefas"):
+                                st.session_state.df_master = st.session_state.df_master.drop(labels_kr)
+                                marcar_alteracao(antes=df_kr_tasks)
+                                st.rerun()
+
+                            # Barra de progresso do KR
+                            st.progress(rollups.progresso(depto, obj, kr))
+
+                            # --- TABELA DE TAREFAS (OTIMIZADA) ---
+                            # Edições são aplicadas no df_master pelo callback (sem rerun manual)
+                            editor_key = f"editor_{depto}_{obj}_{kr}"
+                            st.data_editor(
+                                expandir_df(df_kr_tasks),
+                                column_config=config_editor_tarefas(),
+                                key=editor_key,
+                                use_container_width=True,
+                                num_rows="dynamic",
+                                hide_index=True, # Remove a coluna numérica da esquerda
+                                on_change=aplicar_edicoes_kr,
+                                args=(editor_key, labels_kr, depto, obj, kr, cliente)
+                            )
+
+                        # Botão para adicionar novo KR dentro do Objetivo
+                        if st.button(f"➕ Adicionar KR em '{obj}'", key=f"add_new_kr_{depto}_{obj}"):
+                            new_row = {
+                                'departamento': depto, 'objetivo': obj, 'kr': 'Novo KR', 'tarefa': 'Tarefa 1',
+                                'status': 'Não Iniciado', 'avanco': 0.0, 'alvo': 1.0, 'progresso_pct': 0.0,
+                                'prazo': date.today(), 'responsavel': st.session_state.user['name'], 'cliente': cliente
+                            }
+                            novas = anexar_linhas([new_row])
+                            marcar_alteracao(depois=st.session_state.df_master.loc[novas])
                             st.rerun()
 
-                        # Barra de progresso do KR
-                        prog_kr = df_kr_tasks['progresso_pct'].mean()
-                        st.progress(prog_kr)
-
-                        # --- TABELA DE TAREFAS (OTIMIZADA) ---
-                        column_config = {
-                            "tarefa": st.column_config.TextColumn("Tarefa", width="large", required=True),
-                            "status": st.column_config.SelectboxColumn("Status", options=list(CORES_STATUS.keys()), required=True),
-                            "avanco": st.column_config.NumberColumn("Real", min_value=0),
-                            "alvo": st.column_config.NumberColumn("Meta", min_value=0.1),
-                            "progresso_pct": st.column_config.ProgressColumn("%", format="%.0f%%", min_value=0, max_value=1),
-                            "prazo": st.column_config.DateColumn("Prazo", format="DD/MM/YYYY"),
-                            "responsavel": st.column_config.TextColumn("Resp."),
-                            # Ocultar colunas técnicas
-                            "id": None, "created_at": None, 
-                            "departamento": None, "objetivo": None, "kr": None, "cliente": None
-                        }
-
-                        edited_df = st.data_editor(
-                            df_kr_tasks,
-                            column_config=column_config,
-                            key=f"editor_{depto}_{obj}_{kr}",
-                            use_container_width=True,
-                            num_rows="dynamic",
-                            hide_index=True # Remove a coluna numérica da esquerda
-                        )
-
-                        # Salvar edições na memória (sem rerun)
-                        if not edited_df.equals(df_kr_tasks):
-                            # Recalcula
-                            edited_df['progresso_pct'] = calcular_progresso_vetorizado(edited_df)
-                            # Garante integridade
-                            edited_df['departamento'] = depto
-                            edited_df['objetivo'] = obj
-                            edited_df['kr'] = kr
-                            edited_df['cliente'] = cliente
-                            
-                            # Atualiza Master
-                            df_sem_kr = st.session_state.df_master.drop(df_kr_tasks.index)
-                            st.session_state.df_master = pd.concat([df_sem_kr, edited_df], ignore_index=True)
-                            
-                            # Ativa botão de salvar
-                            st.session_state.needs_save = True
-                            # Nota: Sem st.rerun() aqui para não travar a digitação
-
-                    # Botão para adicionar novo KR dentro do Objetivo
-                    if st.button(f"➕ Adicionar KR em '{obj}'", key=f"add_new_kr_{depto}_{obj}"):
-                        new_row = {
-                            'departamento': depto, 'objetivo': obj, 'kr': 'Novo KR', 'tarefa': 'Tarefa 1',
-                            'status': 'Não Iniciado', 'avanco': 0.0, 'alvo': 1.0, 'progresso_pct': 0.0,
-                            'prazo': date.today(), 'responsavel': st.session_state.user['name'], 'cliente': cliente
-                        }
-                        st.session_state.df_master = pd.concat([st.session_state.df_master, pd.DataFrame([new_row])], ignore_index=True)
-                        st.session_state.needs_save = True
-                        st.rerun()
+MAX_RESULTADOS_BUSCA = 500
+
+def render_busca():
+    """Busca de tarefas por texto, responsável, status e prazo, com edição direta dos resultados"""
+    df = st.session_state.df_master
+    if df.empty:
+        st.info("Nenhuma tarefa cadastrada.")
+        return
+    indice = obter_indice_busca()
+
+    c_txt, c_minhas = st.columns([4, 1])
+    texto = c_txt.text_input("Buscar", key="busca_texto", placeholder="🔎 Objetivo, KR ou tarefa...",
+                             label_visibility="collapsed")
+    minhas = c_minhas.toggle("Minhas tarefas", key="busca_minhas")
+    c_resp, c_status, c_prazo = st.columns(3)
+    responsaveis = c_resp.multiselect("Responsável", sorted(indice['facetas'].get('responsavel', {}), key=str),
+                                      key="busca_responsaveis", disabled=minhas)
+    status = c_status.multiselect("Status", list(CORES_STATUS), key="busca_status")
+    prazos = c_prazo.multiselect("Prazo", list(CORES_PRAZO), key="busca_prazos")
+    if minhas:
+        responsaveis = [st.session_state.user['name']]
+
+    inicio = time.perf_counter()
+    labels = buscar_tarefas(indice, texto, responsaveis, status, prazos)
+    ms = (time.perf_counter() - inicio) * 1000
+    if not len(labels):
+        st.caption(f"Nenhuma tarefa encontrada ({ms:.1f} ms).")
+        return
+
+    # Prazos mais próximos primeiro
+    resultado = df.loc[labels].sort_values('prazo', na_position='last').head(MAX_RESULTADOS_BUSCA)
+    st.caption(f"{len(labels)} tarefas em {ms:.1f} ms"
+               + (f" · exibindo as {MAX_RESULTADOS_BUSCA} de prazo mais próximo" if len(labels) > MAX_RESULTADOS_BUSCA else ""))
+
+    # A chave muda a cada versão dos dados: após uma edição as posições da grade deixam de valer
+    editor_key = f"editor_busca_{st.session_state.df_versao}"
+    st.data_editor(
+        expandir_df(resultado),
+        column_config=config_editor_tarefas(com_hierarquia=True),
+        column_order=['departamento', 'objetivo', 'kr', 'tarefa', 'status', 'responsavel', 'prazo',
+                      'avanco', 'alvo', 'progresso_pct'],
+        key=editor_key,
+        use_container_width=True,
+        hide_index=True,
+        on_change=aplicar_delta_editor,
+        args=(editor_key, resultado.index)
+    )
+
+def eh_admin(user):
+    return bool(user) and user.get('username') in ADMINS
+
+ORDENACAO_PORTFOLIO = {
+    "Risco": ('risco', False), "Atrasados": ('atrasados', False),
+    "Menor progresso": ('progresso_medio', True), "Mais KRs": ('total', False), "Cliente": ('cliente', True),
+}
+
+def render_portfolio():
+    c_info, c_ord, c_atu = st.columns([3, 2, 1])
+    ordem = c_ord.selectbox("Ordenar por", list(ORDENACAO_PORTFOLIO), key="ordem_portfolio", label_visibility="collapsed")
+    if c_atu.button("🔄", help="Recalcular agora (o resultado fica em cache por alguns minutos)", use_container_width=True):
+        carregar_portfolio.clear()
+    try:
+        carteira = carregar_portfolio(date.today())
+    except _FalhaConsulta:
+        return
+    if carteira.empty:
+        st.info("Nenhum cliente com tarefas cadastradas.")
+        return
+    c_info.caption(f"{len(carteira)} clientes · índice de risco = atrasados ({PESOS_RISCO['atrasados']:.0%}), "
+                   f"vencendo em 7 dias ({PESOS_RISCO['urgentes']:.0%}) e progresso que falta ({PESOS_RISCO['falta_progresso']:.0%})")
+
+    m1, m2, m3, m4 = st.columns(4)
+    total = int(carteira['total'].sum())
+    with m1: render_metric_card("Clientes", len(carteira))
+    with m2: render_metric_card("Total de KRs", total)
+    with m3:
+        media = (carteira['progresso_medio'] * carteira['total']).sum() / total if total else 0.0
+        render_metric_card("Progresso Médio", f"{media:.1%}")
+    with m4:
+        em_risco = int((carteira['risco'] >= 50).sum())
+        render_metric_card("Clientes em risco", em_risco, delta=-em_risco if em_risco else 0, delta_color="inverse")
+
+    coluna, crescente = ORDENACAO_PORTFOLIO[ordem]
+    st.dataframe(
+        carteira.sort_values(coluna, ascending=crescente, ignore_index=True),
+        use_container_width=True, hide_index=True,
+        column_order=['cliente', 'risco', 'total', 'progresso_medio', 'atrasados', 'pct_atrasados', 'urgentes', 'concluidos', 'linhas'],
+        column_config={
+            'cliente': "Cliente",
+            'risco': st.column_config.ProgressColumn("Risco", format="%.0f", min_value=0, max_value=100),
+            'total': "KRs", 'atrasados': "Atrasados", 'urgentes': "Vencem em 7 dias", 'concluidos': "Concluídos",
+            'linhas': "Linhas",
+            'progresso_medio': st.column_config.ProgressColumn("Progresso", format="percent", min_value=0, max_value=1),
+            'pct_atrasados': st.column_config.NumberColumn("% Atrasados", format="percent"),
+        },
+    )
+
+def render_admin_page():
+    metricas = METRICAS.exportar()
+
+    st.subheader("Pool de Conexões")
+    c1, c2, c3 = st.columns(3)
+    checkout = metricas['checkout']
+    with c1: render_metric_card("Checkouts", checkout['qtd'])
+    with c2: render_metric_card("Espera média", f"{checkout['media_ms']:.1f} ms")
+    with c3: render_metric_card("Espera máxima", f"{checkout['max_ms']:.1f} ms")
+    st.json(metricas['pool'], expanded=False)
+
+    st.subheader("Consultas")
+    st.caption(f"Desde {metricas['desde']} · lentas a partir de {metricas['limite_lento_ms']:.0f} ms")
+    if metricas['consultas']:
+        df_q = pd.DataFrame(metricas['consultas'])[['sql', 'qtd', 'total_ms', 'media_ms', 'max_ms', 'linhas', 'erros']]
+        st.dataframe(df_q, use_container_width=True, hide_index=True,
+                     column_config={c: st.column_config.NumberColumn(format="%.1f") for c in ['total_ms', 'media_ms', 'max_ms']})
+    if metricas['lentas']:
+        st.subheader("Consultas Lentas")
+        st.dataframe(pd.DataFrame(metricas['lentas']).iloc[::-1], use_container_width=True, hide_index=True)
+
+    st.subheader("Exportação de Todos os Clientes")
+    render_exportacao(key="exportar_admin")
+
+    st.subheader("Cache de Clientes")
+    st.json(get_cache_clientes().estatisticas(), expanded=False)
+
+    c1, c2 = st.columns(2)
+    c1.download_button("⬇️ Exportar métricas (JSON)", METRICAS.exportar_json(), file_name="metricas_banco.json",
+                       mime="application/json", use_container_width=True)
+    if c2.button("Zerar métricas", use_container_width=True):
+        METRICAS.limpar()
+        st.rerun()
+
+def painel_perfil_visivel():
+    # Painel de desenvolvedor: só para admins (o registro vale para o processo inteiro) e
+    # escondido, a menos que o profiling esteja ligado ou a URL tenha ?perfil=1
+    return eh_admin(st.session_state.user) and (PERFIL.ativo or st.query_params.get("perfil") == "1")
+
+def _alternar_perfil():
+    PERFIL.ativo = st.session_state.perfil_ativo
+
+def render_painel_perfil():
+    exp = st.expander("⏱️ Perfil por rerun", key="exp_perfil", on_change="rerun")
+    if not exp.open:
+        return
+    with exp:
+        # Liga/desliga para o processo inteiro (vale a partir do próximo rerun); o toggle mostra o
+        # estado atual, que outro admin pode ter mudado, e só o altera quando é clicado
+        st.session_state.perfil_ativo = PERFIL.ativo
+        st.toggle("Registrar spans", key="perfil_ativo", on_change=_alternar_perfil)
+        estatisticas = PERFIL.estatisticas()
+        if not estatisticas:
+            st.caption("Nenhuma execução registrada.")
+            return
+        st.caption("Tempos inclusivos (etapas aninhadas se sobrepõem); blocos = sys.getallocatedblocks(), "
+                   "inclui outras threads.")
+        st.dataframe(pd.DataFrame(estatisticas)[['etapa', 'execucoes', 'p50_ms', 'p95_ms', 'p95_blocos']],
+                     hide_index=True, use_container_width=True,
+                     column_config={c: st.column_config.NumberColumn(format="%.1f") for c in ['p50_ms', 'p95_ms']})
+        c1, c2 = st.columns(2)
+        c1.download_button("⬇️ JSON", PERFIL.exportar_json(), file_name="perfil_reruns.json",
+                           mime="application/json", use_container_width=True)
+        if c2.button("Zerar", key="perfil_zerar", use_container_width=True):
+            PERFIL.limpar()
+            st.rerun()
 
 # ==========================================
 # 5. EXECUÇÃO PRINCIPAL
 # ==========================================
 
+def encerrar_sessao():
+    get_fila_autosave().remover(st.session_state.sessao_id)
+    st.session_state.clear()
+    st.rerun()
+
+def processar_saida(autosave):
+    """Logout sem perder edições: grava a fila do salvamento automático ou pergunta pelas alterações manuais"""
+    if autosave:
+        # Inclui as edições deste rerun que ainda não foram enfileiradas
+        enfileirar_autosave()
+        estado = get_fila_autosave().descarregar(st.session_state.sessao_id)
+        if estado['status'] == 'erro' or estado['pendente'] or estado['em_voo']:
+            st.session_state.saindo = False
+            st.sidebar.error(f"Não foi possível salvar as alterações pendentes ({estado['erro'] or 'tempo esgotado'}). "
+                             "Tente sair novamente.")
+            return
+        encerrar_sessao()
+    if not st.session_state.needs_save:
+        encerrar_sessao()
+
+    with st.sidebar:
+        st.warning("⚠️ Há alterações não salvas.")
+        if st.button("💾 Salvar e sair", type="primary", use_container_width=True, key="sair_salvar"):
+            with st.spinner("Salvando..."):
+                relatorio = salvar_dados_batch(st.session_state.df_master, st.session_state.user['cliente'],
+                                               snapshot=st.session_state.df_snapshot)
+            if relatorio is not None:
+                encerrar_sessao()
+        if st.button("Sair sem salvar", use_container_width=True, key="sair_descartar"):
+            encerrar_sessao()
+        if st.button("Cancelar", use_container_width=True, key="sair_cancelar"):
+            st.session_state.saindo = False
+            st.rerun()
+
 def main():
     if 'user' not in st.session_state: st.session_state.user = None
     if 'df_master' not in st.session_state: st.session_state.df_master = pd.DataFrame()
     if 'needs_save' not in st.session_state: st.session_state.needs_save = False
+    if 'df_versao' not in st.session_state: st.session_state.df_versao = 0
+    if 'df_snapshot' not in st.session_state: st.session_state.df_snapshot = None
+    if 'ultimo_save' not in st.session_state: st.session_state.ultimo_save = None
+    if 'sessao_id' not in st.session_state: st.session_state.sessao_id = uuid.uuid4().hex
 
     if not st.session_state.user:
         show_login_page()
@@ -428,56 +1871,127 @@ def main():
         
         # Placeholder para o botão de salvar aparecer instantaneamente
         save_container = st.empty()
+        autosave = st.toggle("💾 Salvamento automático", key="autosave",
+                             value=os.getenv("OKR_AUTOSAVE", "0") == "1")
         
+        if st.session_state.ultimo_save:
+            r = st.session_state.ultimo_save
+            st.caption(f"Último salvamento: {r['inseridos']} inseridas, {r['atualizados']} alteradas, {r['removidos']} removidas")
+
         st.divider()
-        menu = st.radio("Menu", ["📊 Dashboard", "⚙️ Painel de Gestão", "🏢 Departamentos"])
+        opcoes_menu = ["📊 Dashboard", "⚙️ Painel de Gestão", "🔎 Buscar Tarefas", "🏢 Departamentos"]
+        if eh_admin(st.session_state.user):
+            opcoes_menu += ["💼 Carteira de Clientes", "🛠️ Administração"]
+        menu = st.radio("Menu", opcoes_menu)
         st.divider()
-        
+
+        # Relatório de memória sob demanda (só calcula com o expander aberto)
+        if st.session_state.df_snapshot is not None:
+            exp_mem = st.expander("🧠 Memória da sessão", key="exp_memoria", on_change="rerun")
+            if exp_mem.open:
+                with exp_mem:
+                    df_mem = relatorio_memoria(st.session_state.df_master)
+                    st.caption(f"{len(st.session_state.df_master)} linhas · {df_mem['kb'].sum() / 1024:.2f} MB")
+                    st.dataframe(df_mem, hide_index=True, use_container_width=True)
+
+        if painel_perfil_visivel():
+            render_painel_perfil()
+
         if st.button("Sair", use_container_width=True):
-            st.session_state.clear()
-            st.rerun()
+            # Tratado no fim do rerun, depois que o painel aplicou as edições vindas dos widgets
+            st.session_state.saindo = True
+
+    fila = get_fila_autosave()
+    if autosave:
+        aplicar_autosave()
+        enfileirar_autosave()
+        with save_container.container():
+            ocupado = fila.status(st.session_state.sessao_id)
+            st.fragment(render_status_autosave,
+                        run_every="2s" if ocupado['pendente'] or ocupado['em_voo'] else None)()
+            if st.session_state.needs_save and st.button("Salvar agora", use_container_width=True):
+                enfileirar_autosave()
+                fila.descarregar(st.session_state.sessao_id)
+                aplicar_autosave()
+                st.rerun()
+    elif st.session_state.get('autosave_versao') is not None:
+        # Autosave desligado: termina o que está na fila antes de voltar ao salvamento manual
+        fila.descarregar(st.session_state.sessao_id)
+        aplicar_autosave()
+        fila.remover(st.session_state.sessao_id)
+        st.session_state.autosave_versao = None
 
     # Renderiza o botão de salvar SE houver mudanças
-    if st.session_state.needs_save:
+    if st.session_state.needs_save and not autosave:
         with save_container.container():
             st.warning("⚠️ Há alterações pendentes")
+            if st.session_state.get('tenant_versao') != get_cache_clientes().versao(st.session_state.user['cliente']):
+                st.caption("ℹ️ Outra sessão salvou dados deste cliente desde que você os abriu.")
             if st.button("💾 SALVAR TUDO", type="primary", use_container_width=True):
                 with st.spinner("Salvando..."):
-                    if salvar_dados_batch(st.session_state.df_master, st.session_state.user['cliente']):
+                    relatorio = salvar_dados_batch(st.session_state.df_master, st.session_state.user['cliente'],
+                                                   snapshot=st.session_state.df_snapshot)
+                    if relatorio is not None:
+                        aplicar_resultado_save(relatorio)
                         st.session_state.needs_save = False
                         st.success("Salvo com sucesso!")
-                        time.sleep(0.5)
                         st.rerun()
 
     # Conteúdo Principal
     user = st.session_state.user
-    if menu == "📊 Dashboard":
-        st.title("Dashboard Analítico")
-        render_dashboard(st.session_state.df_master)
+    with PERFIL.span(f"menu: {menu}"):
+        if menu == "📊 Dashboard":
+            st.title("Dashboard Analítico")
+            # Com alterações pendentes o banco está defasado: agrega em memória
+            if st.session_state.needs_save:
+                render_dashboard(cliente=user['cliente'], rollups=obter_rollups())
+            else:
+                render_dashboard(cliente=user['cliente'])
     
-    elif menu == "⚙️ Painel de Gestão":
-        st.title("Painel de Gestão")
-        depto_list = get_departamentos(user['cliente'])
-        render_management_panel(st.session_state.df_master, user['cliente'], depto_list)
+        elif menu == "⚙️ Painel de Gestão":
+            st.title("Painel de Gestão")
+            garantir_dados_carregados()
+            depto_list = get_departamentos(user['cliente'])
+            render_management_panel(st.session_state.df_master, user['cliente'], depto_list)
         
-    elif menu == "🏢 Departamentos":
-        st.title("Departamentos")
-        with st.form("new_dep"):
-            d = st.text_input("Nome")
-            if st.form_submit_button("Adicionar") and d:
-                run_query("INSERT INTO departamentos (nome, cliente) VALUES (:n, :c)", {'n': d, 'c': user['cliente']}, is_select=False)
-                get_departamentos.clear()
-                st.rerun()
-        
-        deps = get_departamentos(user['cliente'])
-        if deps:
-            for dep in deps:
-                c1, c2 = st.columns([4, 1])
-                c1.write(f"• {dep}")
-                if c2.button("Excluir", key=f"del_dep_{dep}"):
-                    run_query("DELETE FROM departamentos WHERE nome=:n AND cliente=:c", {'n': dep, 'c': user['cliente']}, is_select=False)
+        elif menu == "🔎 Buscar Tarefas":
+            st.title("Buscar Tarefas")
+            garantir_dados_carregados()
+            render_busca()
+
+        elif menu == "🏢 Departamentos":
+            st.title("Departamentos")
+            with st.form("new_dep"):
+                d = st.text_input("Nome")
+                if st.form_submit_button("Adicionar") and d:
+                    if d in get_departamentos(user['cliente']):
+                        st.warning("Departamento já existe.")
+                        st.stop()
+                    run_query("INSERT INTO departamentos (nome, cliente) VALUES (:n, :c)", {'n': d, 'c': user['cliente']}, is_select=False)
                     get_departamentos.clear()
                     st.rerun()
+        
+            deps = get_departamentos(user['cliente'])
+            if deps:
+                for dep in deps:
+                    c1, c2 = st.columns([4, 1])
+                    c1.write(f"• {dep}")
+                    if c2.button("Excluir", key=f"del_dep_{dep}"):
+                        run_query("DELETE FROM departamentos WHERE nome=:n AND cliente=:c", {'n': dep, 'c': user['cliente']}, is_select=False)
+                        get_departamentos.clear()
+                        st.rerun()
+
+        elif menu == "💼 Carteira de Clientes":
+            st.title("Carteira de Clientes")
+            render_portfolio()
+
+        elif menu == "🛠️ Administração":
+            st.title("Administração")
+            render_admin_page()
+
+    if st.session_state.get('saindo'):
+        processar_saida(autosave)
 
 if __name__ == "__main__":
-    main()
+    with PERFIL.execucao("rerun"):
+        main()
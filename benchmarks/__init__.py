@@ -0,0 +1,9 @@
+"""Benchmarks do OKR Master com clientes sintéticos.
+
+Uso:
+    python -m benchmarks --tamanhos 3x5x4x10 6x10x5x20 --saida resultados.json
+    python -m benchmarks --tamanhos 3x5x4x10 --comparar resultados_anteriores.json
+
+Cada tamanho é departamentos x objetivos x KRs x tarefas. Sem --db, usa um
+SQLite temporário; com --db aponta para um Postgres local de testes.
+"""
@@ -0,0 +1,194 @@
+"""Executa os benchmarks das etapas de dados e renderização e grava o resultado em JSON."""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from datetime import datetime
+
+def _tamanho(valor):
+    partes = valor.lower().split("x")
+    if len(partes) != 4 or not all(p.isdigit() and int(p) > 0 for p in partes):
+        raise argparse.ArgumentTypeError("use departamentos x objetivos x KRs x tarefas, ex.: 3x5x4x10")
+    return tuple(int(p) for p in partes)
+
+def _argumentos():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__)
+    parser.add_argument("--tamanhos", nargs="+", type=_tamanho, default=[(3, 5, 4, 10), (6, 10, 5, 20)])
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--db", help="URL do banco de testes (padrão: SQLite temporário)")
+    parser.add_argument("--saida", help="arquivo JSON de saída (padrão: stdout)")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior para comparar")
+    parser.add_argument("--limite-regressao", type=float, default=1.25,
+                        help="razão atual/anterior a partir da qual a etapa é considerada regressão")
+    parser.add_argument("--sem-render", action="store_true", help="pula as etapas de renderização (AppTest)")
+    return parser.parse_args()
+
+def medir(funcao, repeticoes, preparar=None):
+    tempos = []
+    for _ in range(repeticoes):
+        if preparar:
+            preparar()
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return {'min_ms': min(tempos), 'mediana_ms': statistics.median(tempos), 'execucoes': repeticoes}
+
+# Scripts executados pelo AppTest (o código-fonte da função vira o script do app)
+def _script_dashboard(cliente, memoria):
+    import app
+    if memoria:
+        app.render_dashboard(rollups=app.obter_rollups())
+    else:
+        app.render_dashboard(cliente=cliente)
+
+def _script_painel(cliente):
+    import streamlit as st
+    import app
+    app.render_management_panel(st.session_state.df_master, cliente, [])
+
+def medir_render(script, args, estado, repeticoes):
+    from streamlit.testing.v1 import AppTest
+
+    def executar():
+        at = AppTest.from_function(script, args=args, default_timeout=600)
+        for chave, valor in estado.items():
+            at.session_state[chave] = valor
+        at.run()
+        if at.exception:
+            raise RuntimeError(at.exception[0].message)
+    return medir(executar, repeticoes)
+
+def executar_tamanho(app, engine, tamanho, repeticoes, com_render):
+    from benchmarks.gerador import gerar_cliente, popular_banco, perturbar
+
+    departamentos, objetivos, krs, tarefas = tamanho
+    cliente = f"bench_{departamentos}x{objetivos}x{krs}x{tarefas}"
+    popular_banco(engine, gerar_cliente(cliente, *tamanho))
+
+    df = app.carregar_dados_cliente(cliente)
+
+    carga = {}
+    def preparar_save():
+        # Recarrega o snapshot depois de repopular: os ids mudam a cada carga (serial no Postgres)
+        popular_banco(engine, gerar_cliente(cliente, *tamanho))
+        carga['snapshot'] = app.carregar_dados_cliente(cliente)
+        carga['editado'] = perturbar(carga['snapshot'])
+
+    etapas = {
+        'carregar_dados_cliente': medir(lambda: app.carregar_dados_cliente(cliente), repeticoes),
+        'classificar_prazo_vetorizado': medir(lambda: app.classificar_prazo_vetorizado(df), repeticoes),
+        'calcular_progresso_vetorizado': medir(lambda: app.calcular_progresso_vetorizado(df), repeticoes),
+        'agregar_dashboard_memoria': medir(lambda: app.agregar_dashboard_memoria(df), repeticoes),
+        'agregar_dashboard_sql': medir(
+            lambda: app.carregar_dashboard_agregado.__wrapped__(cliente, datetime.now().date()), repeticoes
+        ),
+        'construir_indice': medir(lambda: app.construir_indice(df), repeticoes),
+        # Cada repetição parte do mesmo estado no banco
+        'salvar_dados_batch': medir(
+            lambda: app.salvar_dados_batch(carga['editado'], cliente, snapshot=carga['snapshot']), repeticoes,
+            preparar=preparar_save
+        ),
+    }
+
+    if com_render:
+        popular_banco(engine, gerar_cliente(cliente, *tamanho))
+        df = app.carregar_dados_cliente(cliente)
+        estado = {
+            'user': {'name': 'Benchmark', 'username': 'benchmark', 'cliente': cliente},
+            'df_master': df, 'df_snapshot': df, 'df_versao': 1, 'needs_save': False,
+        }
+        etapas['render_dashboard_sql'] = medir_render(_script_dashboard, (cliente, False), estado, repeticoes)
+        etapas['render_dashboard_memoria'] = medir_render(_script_dashboard, (cliente, True), estado, repeticoes)
+        etapas['render_management_panel'] = medir_render(_script_painel, (cliente,), estado, repeticoes)
+        # Um objetivo aberto (materializa os editores dos KRs)
+        aberto = {**estado, 'busca_Depto 0': 'Objetivo 0.0'}
+        etapas['render_management_panel_objetivo_aberto'] = medir_render(_script_painel, (cliente,), aberto, repeticoes)
+
+    return {
+        'cliente': cliente,
+        'tamanho': dict(zip(['departamentos', 'objetivos', 'krs', 'tarefas'], tamanho)),
+        'linhas': int(len(df)),
+        'etapas': etapas,
+    }
+
+def _versao_codigo():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except Exception:
+        return None
+
+def comparar(atual, anterior, limite):
+    """Imprime a razão atual/anterior por etapa e retorna o número de regressões"""
+    base = {r['cliente']: r['etapas'] for r in anterior['resultados']}
+    regressoes = 0
+    print(f"Comparando com {anterior.get('versao_codigo')} ({anterior.get('executado_em')})", file=sys.stderr)
+    for resultado in atual['resultados']:
+        etapas_base = base.get(resultado['cliente'])
+        if not etapas_base:
+            continue
+        print(f"\n{resultado['cliente']} ({resultado['linhas']} linhas)", file=sys.stderr)
+        for etapa, medida in resultado['etapas'].items():
+            if etapa not in etapas_base:
+                continue
+            razao = medida['mediana_ms'] / max(etapas_base[etapa]['mediana_ms'], 1e-6)
+            marca = "  <-- regressão" if razao >= limite else ""
+            regressoes += bool(marca)
+            print(f"  {etapa:45s} {etapas_base[etapa]['mediana_ms']:10.2f} -> {medida['mediana_ms']:10.2f} ms"
+                  f"  ({razao:.2f}x){marca}", file=sys.stderr)
+    return regressoes
+
+def main():
+    args = _argumentos()
+
+    # O app lê DATABASE_URL ao ser importado
+    temporario = None
+    if args.db:
+        os.environ["DATABASE_URL"] = args.db
+    else:
+        temporario = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+        temporario.close()
+        os.environ["DATABASE_URL"] = f"sqlite:///{temporario.name}"
+    os.environ.setdefault("OKR_AUTO_MIGRAR", "1")
+
+    import pandas as pd
+    import app
+
+    try:
+        resultados = [
+            executar_tamanho(app, app.engine, tamanho, args.repeticoes, not args.sem_render)
+            for tamanho in args.tamanhos
+        ]
+    finally:
+        if temporario:
+            app.engine.dispose()
+            os.unlink(temporario.name)
+
+    saida = {
+        'executado_em': datetime.now().isoformat(timespec='seconds'),
+        'versao_codigo': _versao_codigo(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'banco': app.engine.dialect.name,
+        'repeticoes': args.repeticoes,
+        'resultados': resultados,
+    }
+    texto = json.dumps(saida, ensure_ascii=False, indent=2)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            f.write(texto)
+    else:
+        print(texto)
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            regressoes = comparar(saida, json.load(f), args.limite_regressao)
+        sys.exit(1 if regressoes else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Geração de clientes sintéticos para os benchmarks."""
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+STATUS = ["Concluído", "Em Andamento", "Pausado", "Não Iniciado"]
+
+def gerar_cliente(cliente, departamentos, objetivos, krs, tarefas, seed=0):
+    """DataFrame no formato da tabela okrs com departamentos x objetivos x KRs x tarefas linhas"""
+    rng = np.random.default_rng(seed)
+    d, o, k, t = np.meshgrid(np.arange(departamentos), np.arange(objetivos), np.arange(krs), np.arange(tarefas), indexing='ij')
+    n = d.size
+
+    alvo = rng.integers(1, 100, n).astype(float)
+    avanco = np.floor(alvo * rng.random(n))
+    prazo = pd.Series(pd.Timestamp(date.today()) + pd.to_timedelta(rng.integers(-30, 90, n), unit='D'))
+    prazo[rng.random(n) < 0.05] = pd.NaT
+
+    return pd.DataFrame({
+        'departamento': np.char.add("Depto ", d.ravel().astype(str)),
+        'objetivo': np.char.add(np.char.add("Objetivo ", d.ravel().astype(str)), np.char.add(".", o.ravel().astype(str))),
+        'kr': np.char.add("KR ", k.ravel().astype(str)),
+        'tarefa': np.char.add("Tarefa ", t.ravel().astype(str)),
+        'status': np.array(STATUS)[rng.integers(0, len(STATUS), n)],
+        'responsavel': np.char.add("Pessoa ", rng.integers(0, 20, n).astype(str)),
+        'prazo': prazo.dt.date,
+        'avanco': avanco,
+        'alvo': alvo,
+        'progresso_pct': np.clip(avanco / alvo, 0, 1),
+        'cliente': cliente,
+    })
+
+def popular_banco(engine, df, lote=5000):
+    """Grava o cliente sintético (e seus departamentos) substituindo dados anteriores"""
+    from database import OKRS, DEPARTAMENTOS
+
+    cliente = df['cliente'].iloc[0]
+    registros = df.astype(object).where(df.notna(), None).to_dict('records')
+    with engine.begin() as conn:
+        conn.execute(OKRS.delete().where(OKRS.c.cliente == cliente))
+        conn.execute(DEPARTAMENTOS.delete().where(DEPARTAMENTOS.c.cliente == cliente))
+        for inicio in range(0, len(registros), lote):
+            conn.execute(OKRS.insert(), registros[inicio:inicio + lote])
+        conn.execute(DEPARTAMENTOS.insert(), [{'nome': d, 'cliente': cliente} for d in sorted(df['departamento'].unique())])
+
+def perturbar(df, fracao=0.01, seed=1):
+    """Cópia com uma fração das linhas editada, uma inserida e uma removida (carga típica de um save)"""
+    rng = np.random.default_rng(seed)
+    df = df.copy()
+    n = max(1, int(len(df) * fracao))
+    alvo = rng.choice(df.index, size=min(n, len(df)), replace=False)
+    df.loc[alvo, 'avanco'] = df.loc[alvo, 'alvo']
+    df.loc[alvo, 'status'] = "Concluído"
+    novo = df.iloc[[0]].copy()
+    novo['id'] = np.nan
+    novo.index = [df.index.max() + 1]
+    return pd.concat([df.drop(df.index[-1]), novo])
@@ -1 +1,414 @@
+"""Camada de banco: engine, pool de conexões, métricas de consultas e schema.
 
+Uso pela linha de comando (lê DATABASE_URL):
+    python database.py migrar   # cria/atualiza tabelas e índices
+    python database.py check    # lista índices ausentes e planos das consultas principais
+    python database.py compactar [dias_compactar] [dias_reter]   # enxuga o histórico bruto antigo
+"""
+import os
+import re
+import sys
+import json
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import (
+    create_engine, event, inspect, text, func, select, MetaData, Table, Column, Index,
+    Integer, String, Float, Date, DateTime
+)
+
+logger = logging.getLogger("okr.db")
+
+# ==========================================
+# 1. CONFIGURAÇÃO DO POOL
+# ==========================================
+
+def _env_bool(nome, padrao):
+    return os.getenv(nome, padrao).strip().lower() in ("1", "true", "sim", "yes")
+
+def configuracao_pool():
+    """Parâmetros do pool lidos das variáveis de ambiente"""
+    return {
+        'pool_size': int(os.getenv("OKR_DB_POOL_SIZE", "5")),
+        'max_overflow': int(os.getenv("OKR_DB_MAX_OVERFLOW", "10")),
+        'pool_timeout': int(os.getenv("OKR_DB_POOL_TIMEOUT", "30")),
+        'pool_recycle': int(os.getenv("OKR_DB_POOL_RECYCLE", "1800")),
+        'pool_pre_ping': _env_bool("OKR_DB_POOL_PRE_PING", "1"),
+    }
+
+def criar_engine(db_url):
+    """Cria o engine com o pool configurado e a instrumentação de consultas"""
+    kwargs = {}
+    if not db_url.startswith("sqlite"):
+        # SQLite (usado em testes/benchmarks) não aceita os parâmetros de QueuePool
+        kwargs = configuracao_pool()
+    return instrumentar_engine(create_engine(db_url, **kwargs))
+
+# ==========================================
+# 2. MÉTRICAS DE CONSULTAS
+# ==========================================
+
+def _normalizar_sql(sql):
+    return re.sub(r"\s+", " ", str(sql)).strip()[:300]
+
+class MetricasBanco:
+    """Registro em memória (por processo) de tempos de consulta, linhas e checkout do pool"""
+
+    def __init__(self, limite_lento_ms, max_lentas=200):
+        self.limite_lento_ms = limite_lento_ms
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._consultas = {}
+        self._lentas = deque(maxlen=max_lentas)
+        self._checkout = {'qtd': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+        self._engines = []
+        self.inicio = datetime.now()
+
+    def registrar_consulta(self, sql, ms, linhas=None):
+        chave = _normalizar_sql(sql)
+        # Guarda a chave só quando o driver não informou as linhas (ex.: SELECT no SQLite)
+        self._local.ultima = chave if linhas is None or linhas < 0 else None
+        with self._lock:
+            m = self._consultas.setdefault(chave, {'qtd': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'linhas': 0, 'erros': 0})
+            m['qtd'] += 1
+            m['total_ms'] += ms
+            m['max_ms'] = max(m['max_ms'], ms)
+            if linhas is not None and linhas >= 0:
+                m['linhas'] += linhas
+        if ms >= self.limite_lento_ms:
+            with self._lock:
+                self._lentas.append({'quando': datetime.now().isoformat(timespec='seconds'),
+                                     'ms': round(ms, 1), 'sql': chave})
+            logger.warning("Consulta lenta (%.0f ms): %s", ms, chave)
+
+    def registrar_linhas(self, linhas):
+        """Soma as linhas lidas à última consulta desta thread (drivers nem sempre informam rowcount)"""
+        chave = getattr(self._local, 'ultima', None)
+        self._local.ultima = None
+        if chave is None:
+            return
+        with self._lock:
+            if chave in self._consultas:
+                self._consultas[chave]['linhas'] += linhas
+
+    def registrar_erro(self, sql):
+        with self._lock:
+            m = self._consultas.setdefault(_normalizar_sql(sql), {'qtd': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'linhas': 0, 'erros': 0})
+            m['erros'] += 1
+
+    def registrar_checkout(self, ms):
+        with self._lock:
+            self._checkout['qtd'] += 1
+            self._checkout['total_ms'] += ms
+            self._checkout['max_ms'] = max(self._checkout['max_ms'], ms)
+
+    def status_pool(self):
+        status = []
+        for engine in self._engines:
+            pool = engine.pool
+            status.append({
+                'url': engine.url.render_as_string(hide_password=True),
+                'classe': type(pool).__name__,
+                'tamanho': pool.size() if hasattr(pool, 'size') else None,
+                'em_uso': pool.checkedout() if hasattr(pool, 'checkedout') else None,
+                'overflow': pool.overflow() if hasattr(pool, 'overflow') else None,
+                'ociosas': pool.checkedin() if hasattr(pool, 'checkedin') else None,
+            })
+        return status
+
+    def exportar(self):
+        """Resumo serializável em JSON"""
+        with self._lock:
+            consultas = [
+                {'sql': sql, **m, 'media_ms': m['total_ms'] / m['qtd'] if m['qtd'] else 0.0}
+                for sql, m in self._consultas.items()
+            ]
+            checkout = dict(self._checkout)
+            lentas = list(self._lentas)
+        checkout['media_ms'] = checkout['total_ms'] / checkout['qtd'] if checkout['qtd'] else 0.0
+        return {
+            'desde': self.inicio.isoformat(timespec='seconds'),
+            'limite_lento_ms': self.limite_lento_ms,
+            'pool': {'config': configuracao_pool(), 'status': self.status_pool()},
+            'checkout': checkout,
+            'consultas': sorted(consultas, key=lambda c: c['total_ms'], reverse=True),
+            'lentas': lentas,
+        }
+
+    def exportar_json(self):
+        return json.dumps(self.exportar(), ensure_ascii=False, indent=2, default=str)
+
+    def limpar(self):
+        with self._lock:
+            self._consultas.clear()
+            self._lentas.clear()
+            self._checkout = {'qtd': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+            self.inicio = datetime.now()
+
+METRICAS = MetricasBanco(limite_lento_ms=float(os.getenv("OKR_SLOW_QUERY_MS", "500")))
+
+def instrumentar_engine(engine, metricas=METRICAS):
+    """Registra tempo e linhas de toda instrução executada pelo engine"""
+    if engine in metricas._engines:
+        return engine
+    metricas._engines.append(engine)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _antes(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_inicio_consulta', []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _depois(conn, cursor, statement, parameters, context, executemany):
+        ms = (time.perf_counter() - conn.info['_inicio_consulta'].pop()) * 1000
+        metricas.registrar_consulta(statement, ms, getattr(cursor, 'rowcount', None))
+
+    @event.listens_for(engine, "handle_error")
+    def _erro(contexto):
+        if contexto.connection is not None and contexto.connection.info.get('_inicio_consulta'):
+            contexto.connection.info['_inicio_consulta'].pop()
+        metricas.registrar_erro(contexto.statement or '')
+
+    return engine
+
+@contextmanager
+def conexao(engine, transacao=False, metricas=METRICAS):
+    """Abre uma conexão (ou transação) medindo a espera pelo pool"""
+    inicio = time.perf_counter()
+    with (engine.begin() if transacao else engine.connect()) as conn:
+        metricas.registrar_checkout((time.perf_counter() - inicio) * 1000)
+        yield conn
+
+# ==========================================
+# 3. SCHEMA E MIGRAÇÕES
+# ==========================================
+
+metadata = MetaData()
+
+OKRS = Table(
+    'okrs', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('departamento', String), Column('objetivo', String), Column('kr', String),
+    Column('tarefa', String), Column('status', String), Column('responsavel', String),
+    Column('prazo', Date), Column('avanco', Float), Column('alvo', Float),
+    Column('progresso_pct', Float), Column('cliente', String),
+    Column('created_at', DateTime, server_default=func.now()),
+    # carregar_dados_cliente: WHERE cliente = :cli ORDER BY id
+    Index('ix_okrs_cliente_id', 'cliente', 'id'),
+)
+
+USERS = Table(
+    'users', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('username', String, nullable=False), Column('password', String),
+    Column('name', String), Column('cliente', String),
+    # show_login_page: WHERE username = :u AND password = :p
+    Index('ix_users_username_password', 'username', 'password'),
+)
+
+DEPARTAMENTOS = Table(
+    'departamentos', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('nome', String, nullable=False), Column('cliente', String, nullable=False),
+    # get_departamentos: WHERE cliente = :cli ORDER BY nome (e unicidade por cliente)
+    Index('ux_departamentos_cliente_nome', 'cliente', 'nome', unique=True),
+)
+
+# Histórico append-only: uma linha por tarefa cujo avanço, progresso ou status mudou num salvamento
+OKRS_HISTORICO = Table(
+    'okrs_historico', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('cliente', String, nullable=False), Column('okr_id', Integer),
+    Column('departamento', String), Column('objetivo', String), Column('kr', String),
+    Column('evento', String),  # insercao | alteracao | remocao
+    Column('status', String), Column('avanco', Float), Column('progresso_pct', Float),
+    Column('registrado_em', DateTime, server_default=func.now()),
+    Index('ix_okrs_historico_cliente_registrado', 'cliente', 'registrado_em'),
+)
+
+# Fotografia diária dos acumulados por nível (cliente, departamento, objetivo, kr);
+# o último salvamento do dia substitui a fotografia daquele dia
+HISTORICO_DIARIO = Table(
+    'okrs_historico_diario', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('cliente', String, nullable=False), Column('nivel', String, nullable=False),
+    Column('departamento', String), Column('objetivo', String), Column('kr', String),
+    Column('dia', Date, nullable=False),
+    Column('soma_progresso', Float), Column('qtd', Integer), Column('concluidos', Integer), Column('atrasados', Integer),
+    # Gráfico de evolução: WHERE cliente = :cli AND nivel IN (...) AND dia >= :inicio
+    Index('ix_historico_diario_cliente_nivel_dia', 'cliente', 'nivel', 'dia'),
+)
+
+SCHEMA_VERSAO = Table(
+    'schema_versao', metadata,
+    Column('versao', Integer, primary_key=True),
+    Column('descricao', String),
+    Column('aplicada_em', DateTime, server_default=func.now()),
+)
+
+def _criar_tabelas_base(conn):
+    metadata.create_all(conn, tables=[OKRS, USERS, DEPARTAMENTOS], checkfirst=True)
+
+def _deduplicar_departamentos(conn):
+    # Mantém uma linha por (cliente, nome) antes de criar o índice único
+    duplicados = conn.execute(text(
+        "SELECT cliente, nome FROM departamentos GROUP BY cliente, nome HAVING COUNT(*) > 1"
+    )).all()
+    for cliente, nome in duplicados:
+        conn.execute(DEPARTAMENTOS.delete().where(DEPARTAMENTOS.c.cliente == cliente, DEPARTAMENTOS.c.nome == nome))
+        conn.execute(DEPARTAMENTOS.insert().values(cliente=cliente, nome=nome))
+
+def _criar_indices(conn):
+    _deduplicar_departamentos(conn)
+    for tabela in (OKRS, USERS, DEPARTAMENTOS):
+        for indice in tabela.indexes:
+            indice.create(conn, checkfirst=True)
+
+def _criar_historico(conn):
+    metadata.create_all(conn, tables=[OKRS_HISTORICO, HISTORICO_DIARIO], checkfirst=True)
+
+# (versão, descrição, função) — cada migração roda uma única vez, em ordem
+MIGRACOES = [
+    (1, "tabelas okrs, users e departamentos", _criar_tabelas_base),
+    (2, "índices das consultas principais e unicidade de departamentos", _criar_indices),
+    (3, "histórico de progresso e acumulados diários", _criar_historico),
+]
+
+def versao_schema(conn):
+    if not inspect(conn).has_table('schema_versao'):
+        return 0
+    return conn.execute(text("SELECT COALESCE(MAX(versao), 0) FROM schema_versao")).scalar()
+
+def garantir_schema(engine):
+    """Aplica as migrações pendentes (idempotente). Retorna as versões aplicadas agora."""
+    aplicadas = []
+    with engine.begin() as conn:
+        if conn.dialect.name == 'postgresql':
+            # Evita que dois processos migrem ao mesmo tempo
+            conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('okr_schema'))"))
+        SCHEMA_VERSAO.create(conn, checkfirst=True)
+        atual = versao_schema(conn)
+        for versao, descricao, migrar in MIGRACOES:
+            if versao <= atual:
+                continue
+            migrar(conn)
+            conn.execute(SCHEMA_VERSAO.insert().values(versao=versao, descricao=descricao))
+            aplicadas.append(versao)
+    if aplicadas:
+        logger.info("Migrações aplicadas: %s", aplicadas)
+    return aplicadas
+
+# Consultas quentes do app e parâmetros de exemplo para o EXPLAIN
+CONSULTAS_PRINCIPAIS = {
+    'carregar_dados_cliente': ("SELECT * FROM okrs WHERE cliente = :cli ORDER BY id ASC", {'cli': 'x'}),
+    'show_login_page': ("SELECT * FROM users WHERE username=:u AND password=:p", {'u': 'x', 'p': 'x'}),
+    'get_departamentos': ("SELECT nome FROM departamentos WHERE cliente = :cli ORDER BY nome", {'cli': 'x'}),
+    'carregar_evolucao': (
+        "SELECT dia, nivel, departamento, soma_progresso, qtd FROM okrs_historico_diario "
+        "WHERE cliente = :cli AND nivel IN ('cliente', 'departamento') AND dia >= :inicio ORDER BY dia",
+        {'cli': 'x', 'inicio': '2000-01-01'}
+    ),
+}
+
+def verificar_schema(engine):
+    """Relatório com a versão do schema, índices esperados ausentes e os planos das consultas principais"""
+    with engine.connect() as conn:
+        insp = inspect(conn)
+        ausentes = []
+        for tabela in (OKRS, USERS, DEPARTAMENTOS, OKRS_HISTORICO, HISTORICO_DIARIO):
+            if not insp.has_table(tabela.name):
+                ausentes.append({'tabela': tabela.name, 'indice': None, 'colunas': None})
+                continue
+            existentes = {tuple(i['column_names']) for i in insp.get_indexes(tabela.name)}
+            existentes |= {tuple(u['column_names']) for u in insp.get_unique_constraints(tabela.name)}
+            for indice in tabela.indexes:
+                colunas = tuple(c.name for c in indice.columns)
+                if colunas not in existentes:
+                    ausentes.append({'tabela': tabela.name, 'indice': indice.name, 'colunas': list(colunas)})
+
+        prefixo = "EXPLAIN QUERY PLAN " if conn.dialect.name == 'sqlite' else "EXPLAIN "
+        planos = {}
+        for nome, (sql, params) in CONSULTAS_PRINCIPAIS.items():
+            try:
+                linhas = conn.execute(text(prefixo + sql), params).all()
+                planos[nome] = [" | ".join(str(v) for v in linha) for linha in linhas]
+            except Exception as e:
+                planos[nome] = [f"erro: {e}"]
+
+        return {'versao': versao_schema(conn), 'indices_ausentes': ausentes, 'planos': planos}
+
+# ==========================================
+# 4. HISTÓRICO DE PROGRESSO
+# ==========================================
+
+def gravar_historico(conn, cliente, eventos, diario, dia):
+    """Acrescenta os eventos e substitui a fotografia do dia (na transação do salvamento)"""
+    if eventos:
+        conn.execute(OKRS_HISTORICO.insert(), [{**e, 'cliente': cliente} for e in eventos])
+    conn.execute(HISTORICO_DIARIO.delete().where(HISTORICO_DIARIO.c.cliente == cliente, HISTORICO_DIARIO.c.dia == dia))
+    if diario:
+        conn.execute(HISTORICO_DIARIO.insert(), [{**d, 'cliente': cliente, 'dia': dia} for d in diario])
+
+def compactar_historico(engine, dias_compactar=None, dias_reter=None):
+    """Política de retenção do histórico bruto.
+
+    Eventos com mais de `dias_compactar` dias ficam só com o último de cada tarefa
+    por dia; com mais de `dias_reter` dias são apagados. Os acumulados diários
+    (okrs_historico_diario) não são tocados. Retorna quantas linhas saíram.
+    """
+    if dias_compactar is None:
+        dias_compactar = int(os.getenv("OKR_HISTORICO_COMPACTAR_DIAS", "30"))
+    if dias_reter is None:
+        dias_reter = int(os.getenv("OKR_HISTORICO_RETER_DIAS", "365"))
+    agora = datetime.now()
+    h = OKRS_HISTORICO.c
+    with engine.begin() as conn:
+        apagados = conn.execute(OKRS_HISTORICO.delete().where(h.registrado_em < agora - timedelta(days=dias_reter))).rowcount
+        limite = agora - timedelta(days=dias_compactar)
+        ultimos = (
+            select(func.max(h.id)).where(h.registrado_em < limite)
+            .group_by(h.cliente, h.okr_id, func.date(h.registrado_em))
+        )
+        compactados = conn.execute(
+            OKRS_HISTORICO.delete().where(h.registrado_em < limite, h.id.not_in(ultimos))
+        ).rowcount
+    logger.info("Histórico: %s eventos apagados, %s compactados", apagados, compactados)
+    return {'apagados': apagados, 'compactados': compactados}
+
+# Linha de comando
+def _engine_da_env():
+    db_url = os.getenv("DATABASE_URL")
+    if not db_url:
+        sys.exit("Defina DATABASE_URL.")
+    if db_url.startswith("postgres://"):
+        db_url = db_url.replace("postgres://", "postgresql://", 1)
+    return criar_engine(db_url)
+
+if __name__ == "__main__":
+    comando = sys.argv[1] if len(sys.argv) > 1 else "check"
+    engine = _engine_da_env()
+    if comando == "migrar":
+        print(f"Migrações aplicadas: {garantir_schema(engine) or 'nenhuma'}")
+    elif comando == "compactar":
+        dias = [int(a) for a in sys.argv[2:4]]
+        resultado = compactar_historico(engine, *dias)
+        print(f"Eventos apagados: {resultado['apagados']}; compactados: {resultado['compactados']}")
+    elif comando == "check":
+        relatorio = verificar_schema(engine)
+        print(f"Versão do schema: {relatorio['versao']}")
+        if relatorio['indices_ausentes']:
+            print("Índices ausentes:")
+            for item in relatorio['indices_ausentes']:
+                print(f"  - {item['tabela']}: {item['indice'] or 'tabela inexistente'} {item['colunas'] or ''}")
+        else:
+            print("Todos os índices esperados existem.")
+        for nome, plano in relatorio['planos'].items():
+            print(f"\n[{nome}]")
+            for linha in plano:
+                print(f"  {linha}")
+        sys.exit(1 if relatorio['indices_ausentes'] else 0)
+    else:
+        sys.exit(f"Comando desconhecido: {comando} (use 'migrar', 'check' ou 'compactar')")
@@ -0,0 +1,107 @@
+"""Exportação de OKRs em Excel, CSV e Parquet, processada em lotes.
+
+Os dados são lidos em blocos (do banco, via cursor no servidor, ou de um
+DataFrame já em memória) e escritos em streaming, então o pico de memória
+depende do tamanho do lote e não do total de linhas.
+"""
+import tempfile
+
+import pandas as pd
+from openpyxl import Workbook
+from sqlalchemy import text
+
+from database import conexao
+
+# Mesmo layout do converter_excel original (sem colunas técnicas id/created_at)
+COLUNAS_EXPORTACAO = ['departamento', 'objetivo', 'kr', 'tarefa', 'status', 'responsavel',
+                      'prazo', 'avanco', 'alvo', 'progresso_pct', 'cliente']
+
+FORMATOS = {
+    'xlsx': ("Excel", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    'csv': ("CSV", "text/csv"),
+    'parquet': ("Parquet", "application/octet-stream"),
+}
+
+TAMANHO_LOTE = 5000
+
+# ==========================================
+# 1. FONTES (geradores de lotes)
+# ==========================================
+
+def lotes_do_banco(engine, cliente=None, tamanho=TAMANHO_LOTE):
+    """Lê okrs em lotes com cursor no servidor; sem cliente exporta todos os clientes"""
+    colunas = ", ".join(COLUNAS_EXPORTACAO)
+    if cliente is None:
+        query, params = f"SELECT {colunas} FROM okrs ORDER BY cliente, id", {}
+    else:
+        query, params = f"SELECT {colunas} FROM okrs WHERE cliente = :cli ORDER BY id", {'cli': cliente}
+    with conexao(engine) as conn:
+        conn = conn.execution_options(stream_results=True, max_row_buffer=tamanho)
+        for lote in pd.read_sql(text(query), conn, params=params, chunksize=tamanho):
+            yield lote
+
+def lotes_do_dataframe(df, tamanho=TAMANHO_LOTE):
+    for inicio in range(0, len(df), tamanho):
+        yield df.iloc[inicio:inicio + tamanho]
+
+def formatar_lote(df, cliente=None):
+    """Seleciona as colunas exportadas e formata o prazo como dd/mm/aaaa (vetorizado)"""
+    df_exp = df.reindex(columns=COLUNAS_EXPORTACAO)
+    if cliente is not None:
+        df_exp['cliente'] = df_exp['cliente'].fillna(cliente)
+    df_exp['prazo'] = pd.to_datetime(df_exp['prazo'], errors='coerce').dt.strftime('%d/%m/%Y').fillna('')
+    for col in ['avanco', 'alvo', 'progresso_pct']:
+        df_exp[col] = pd.to_numeric(df_exp[col], errors='coerce').astype('float64')
+    for col in ['departamento', 'objetivo', 'kr', 'tarefa', 'status', 'responsavel', 'cliente']:
+        df_exp[col] = df_exp[col].astype(object).where(df_exp[col].notna(), None)
+    return df_exp
+
+# ==========================================
+# 2. ESCRITORES
+# ==========================================
+
+def escrever_excel(lotes, destino):
+    # Modo write-only do openpyxl: as linhas vão direto para o arquivo, sem montar a planilha em memória
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("OKRs")
+    ws.append(COLUNAS_EXPORTACAO)
+    for lote in lotes:
+        valores = lote.astype(object).where(lote.notna(), None)
+        for linha in valores.itertuples(index=False, name=None):
+            ws.append(linha)
+    wb.save(destino)
+
+def escrever_csv(lotes, destino):
+    cabecalho = True
+    for lote in lotes:
+        destino.write(lote.to_csv(index=False, header=cabecalho).encode('utf-8-sig' if cabecalho else 'utf-8'))
+        cabecalho = False
+    if cabecalho:
+        destino.write(pd.DataFrame(columns=COLUNAS_EXPORTACAO).to_csv(index=False).encode('utf-8-sig'))
+
+def escrever_parquet(lotes, destino):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        (c, pa.float64() if c in ('avanco', 'alvo', 'progresso_pct') else pa.string())
+        for c in COLUNAS_EXPORTACAO
+    ])
+    with pq.ParquetWriter(destino, schema) as writer:
+        for lote in lotes:
+            writer.write_table(pa.Table.from_pandas(lote, schema=schema, preserve_index=False))
+
+ESCRITORES = {'xlsx': escrever_excel, 'csv': escrever_csv, 'parquet': escrever_parquet}
+
+def exportar(lotes, formato, cliente=None, destino=None):
+    """Escreve os lotes no formato pedido e devolve o arquivo posicionado no início.
+
+    Sem destino, usa um arquivo temporário que só vai para o disco acima de 32 MB.
+    """
+    if formato not in ESCRITORES:
+        raise ValueError(f"Formato não suportado: {formato}")
+    if destino is None:
+        destino = tempfile.SpooledTemporaryFile(max_size=32 * 1024 * 1024)
+    ESCRITORES[formato]((formatar_lote(lote, cliente) for lote in lotes), destino)
+    destino.seek(0)
+    return destino
@@ -0,0 +1,159 @@
+"""Importação de OKRs em lote a partir de Excel, CSV ou Parquet.
+
+Lê o mesmo layout gerado pela exportação, em blocos: cada bloco é validado de
+forma vetorizada e as linhas válidas seguem para o banco, então o pico de
+memória depende do tamanho do lote e não do total de linhas do arquivo.
+"""
+import csv
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from exportacao import COLUNAS_EXPORTACAO, TAMANHO_LOTE
+
+# Colunas que precisam vir preenchidas; as demais têm valor padrão
+COLUNAS_OBRIGATORIAS = ['departamento', 'objetivo', 'tarefa']
+PADROES = {'kr': '', 'status': 'Não Iniciado', 'responsavel': '', 'avanco': 0.0, 'alvo': 1.0}
+
+FORMATOS_IMPORTACAO = {'xlsx': "Excel", 'csv': "CSV", 'parquet': "Parquet"}
+
+# A linha 1 do arquivo é o cabeçalho
+PRIMEIRA_LINHA = 2
+
+# ==========================================
+# 1. LEITORES (geradores de lotes)
+# ==========================================
+
+def _normalizar_cabecalho(colunas):
+    return [str(c).strip().lower() if c is not None else '' for c in colunas]
+
+def lotes_excel(arquivo, tamanho=TAMANHO_LOTE):
+    # Modo read-only do openpyxl: as linhas são lidas sob demanda, sem carregar a planilha inteira
+    wb = load_workbook(arquivo, read_only=True, data_only=True)
+    try:
+        linhas = wb.worksheets[0].iter_rows(values_only=True)
+        cabecalho = _normalizar_cabecalho(next(linhas, []))
+        bloco = []
+        for linha in linhas:
+            # Linhas em branco continuam no lote para a numeração bater com a planilha
+            linha = linha[:len(cabecalho)]
+            bloco.append(linha + (None,) * (len(cabecalho) - len(linha)))
+            if len(bloco) == tamanho:
+                yield pd.DataFrame(bloco, columns=cabecalho)
+                bloco = []
+        if bloco or not cabecalho:
+            yield pd.DataFrame(bloco, columns=cabecalho)
+    finally:
+        wb.close()
+
+def lotes_csv(arquivo, tamanho=TAMANHO_LOTE):
+    # Aceita "," (exportação do app) e ";" (CSV salvo pelo Excel em português)
+    amostra = arquivo.read(4096)
+    arquivo.seek(0)
+    if isinstance(amostra, bytes):
+        amostra = amostra.decode('utf-8-sig', errors='ignore')
+    try:
+        separador = csv.Sniffer().sniff(amostra.splitlines()[0] if amostra else ',', delimiters=',;\t').delimiter
+    except csv.Error:
+        separador = ','
+    for lote in pd.read_csv(arquivo, sep=separador, dtype=str, encoding='utf-8-sig',
+                            chunksize=tamanho, skip_blank_lines=True):
+        lote.columns = _normalizar_cabecalho(lote.columns)
+        yield lote
+
+def lotes_parquet(arquivo, tamanho=TAMANHO_LOTE):
+    import pyarrow.parquet as pq
+
+    for bloco in pq.ParquetFile(arquivo).iter_batches(batch_size=tamanho):
+        lote = bloco.to_pandas()
+        lote.columns = _normalizar_cabecalho(lote.columns)
+        yield lote
+
+LEITORES = {'xlsx': lotes_excel, 'csv': lotes_csv, 'parquet': lotes_parquet}
+
+def ler_lotes(arquivo, formato, tamanho=TAMANHO_LOTE):
+    if formato not in LEITORES:
+        raise ValueError(f"Formato não suportado: {formato}")
+    return LEITORES[formato](arquivo, tamanho)
+
+def modelo_csv():
+    """Arquivo vazio com o cabeçalho esperado (o mesmo da exportação)"""
+    return pd.DataFrame(columns=COLUNAS_EXPORTACAO).to_csv(index=False).encode('utf-8-sig')
+
+# ==========================================
+# 2. VALIDAÇÃO (vetorizada por lote)
+# ==========================================
+
+def _texto(serie):
+    return serie.astype(object).where(serie.notna(), '').astype(str).str.strip()
+
+def _datas(serie):
+    """Aceita dd/mm/aaaa (exportação), aaaa-mm-dd e datas nativas do Excel"""
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+    br = pd.to_datetime(serie, format='%d/%m/%Y', errors='coerce')
+    return br.fillna(pd.to_datetime(serie, format='ISO8601', errors='coerce'))
+
+def _numeros(serie):
+    """Converte para float aceitando vírgula decimal; retorna (numeros, vazio)"""
+    if pd.api.types.is_numeric_dtype(serie):
+        return serie.astype('float64'), serie.isna()
+    texto = _texto(serie)
+    vazio = texto == ''
+    return pd.to_numeric(texto.str.replace(',', '.', regex=False).where(~vazio), errors='coerce'), vazio
+
+def colunas_ausentes(lote):
+    return [c for c in COLUNAS_OBRIGATORIAS if c not in lote.columns]
+
+def validar_lote(lote, inicio, status_validos, departamentos):
+    """Valida um lote e separa as linhas válidas (já tipadas) dos erros por linha.
+
+    `inicio` é a posição do lote no arquivo, usada para numerar as linhas como
+    na planilha. Retorna (validas, erros), com erros em colunas linha/coluna/valor/erro.
+    """
+    lote = lote.set_axis(pd.RangeIndex(inicio, inicio + len(lote)) + PRIMEIRA_LINHA)
+    # Linhas totalmente em branco são ignoradas
+    preenchidas = pd.concat([_texto(lote[c]) != '' for c in lote.columns], axis=1).any(axis=1) \
+        if len(lote.columns) else pd.Series(False, index=lote.index)
+    lote = lote[preenchidas]
+    linhas = lote.index
+    erros = []
+
+    def registrar(mascara, coluna, mensagem, valores):
+        if mascara.any():
+            erros.append(pd.DataFrame({
+                'linha': linhas[mascara.to_numpy()], 'coluna': coluna,
+                'valor': valores[mascara].astype(str).to_numpy(), 'erro': mensagem,
+            }))
+
+    df = pd.DataFrame(index=linhas)
+    for col in ['departamento', 'objetivo', 'kr', 'tarefa', 'status', 'responsavel']:
+        df[col] = _texto(lote[col]) if col in lote.columns else PADROES.get(col, '')
+
+    for col in COLUNAS_OBRIGATORIAS:
+        registrar(df[col] == '', col, "obrigatório", df[col])
+
+    df['status'] = df['status'].mask(df['status'] == '', PADROES['status'])
+    registrar(~df['status'].isin(status_validos), 'status', "status inválido", df['status'])
+    registrar((df['departamento'] != '') & ~df['departamento'].isin(departamentos),
+              'departamento', "departamento não cadastrado", df['departamento'])
+
+    for col in ['avanco', 'alvo']:
+        if col not in lote.columns:
+            df[col] = PADROES[col]
+            continue
+        numero, vazio = _numeros(lote[col])
+        registrar(~vazio & numero.isna(), col, "número inválido", lote[col])
+        registrar(numero < 0, col, "não pode ser negativo", lote[col])
+        df[col] = numero.fillna(PADROES[col]).astype('float64')
+
+    if 'prazo' in lote.columns:
+        vazio = _texto(lote['prazo']) == ''
+        df['prazo'] = _datas(lote['prazo'].where(~vazio))
+        registrar(~vazio & df['prazo'].isna(), 'prazo', "data inválida (use dd/mm/aaaa)", lote['prazo'])
+    else:
+        df['prazo'] = pd.NaT
+
+    erros = pd.concat(erros, ignore_index=True) if erros else pd.DataFrame(columns=['linha', 'coluna', 'valor', 'erro'])
+    validas = df.drop(index=erros['linha'].unique())
+    return validas, erros
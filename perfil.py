@@ -0,0 +1,160 @@
+"""Perfil por execução do script: tempo de parede e blocos alocados de cada etapa.
+
+Cada rerun do Streamlit (e cada gravação do salvamento automático) vira uma
+execução com os spans medidos dentro dela; as últimas execuções ficam num
+buffer circular. Desligado (padrão), `span` e `execucao` devolvem sempre o
+mesmo contexto nulo e as funções marcadas com `medir` só checam uma flag.
+
+Liga com OKR_PROFILING=1 ou pelo painel de desenvolvedor (?perfil=1 na URL).
+"""
+import os
+import sys
+import json
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from functools import wraps
+
+_NULO = nullcontext()
+
+def _percentil(valores, p):
+    """Percentil com interpolação linear (mesmo critério do numpy)"""
+    ordenados = sorted(valores)
+    if not ordenados:
+        return 0.0
+    k = (len(ordenados) - 1) * p / 100
+    i = int(k)
+    if i + 1 >= len(ordenados):
+        return float(ordenados[-1])
+    return float(ordenados[i] + (ordenados[i + 1] - ordenados[i]) * (k - i))
+
+class Perfilador:
+    """Registro em memória (por processo) das últimas execuções, etapa por etapa"""
+
+    def __init__(self, ativo=False, max_execucoes=200, max_pendentes=100):
+        self.ativo = ativo
+        self.max_pendentes = max_pendentes
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._execucoes = deque(maxlen=max_execucoes)
+        self.inicio = datetime.now()
+
+    def _registrar(self, nome, ms, blocos):
+        etapas = getattr(self._local, 'etapas', None)
+        if etapas is None:
+            # Fora de uma execução (ex.: callback on_change, que roda antes do script):
+            # fica pendente e entra na próxima execução desta thread
+            pendentes = getattr(self._local, 'pendentes', None)
+            if pendentes is None:
+                pendentes = self._local.pendentes = deque(maxlen=self.max_pendentes)
+            pendentes.append((nome, ms, blocos))
+            return
+        m = etapas.setdefault(nome, [0.0, 0, 0])
+        m[0] += ms
+        m[1] += blocos
+        m[2] += 1
+
+    @contextmanager
+    def _medir(self, nome):
+        blocos = sys.getallocatedblocks()
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._registrar(nome, (time.perf_counter() - inicio) * 1000, sys.getallocatedblocks() - blocos)
+
+    @contextmanager
+    def _executar(self, rotulo):
+        if getattr(self._local, 'etapas', None) is not None:
+            # Execução aninhada: os spans continuam na de fora
+            yield
+            return
+        etapas = self._local.etapas = {}
+        for nome, ms, blocos in getattr(self._local, 'pendentes', None) or ():
+            self._registrar(nome, ms, blocos)
+        self._local.pendentes = None
+        quando = datetime.now()
+        blocos = sys.getallocatedblocks()
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            total_ms = (time.perf_counter() - inicio) * 1000
+            self._local.etapas = None
+            registro = {
+                'quando': quando.isoformat(timespec='milliseconds'), 'rotulo': rotulo,
+                'total_ms': total_ms, 'blocos': sys.getallocatedblocks() - blocos,
+                'etapas': {n: {'ms': m[0], 'blocos': m[1], 'chamadas': m[2]} for n, m in etapas.items()},
+            }
+            with self._lock:
+                self._execucoes.append(registro)
+
+    def execucao(self, rotulo):
+        """Agrupa os spans de uma execução (um rerun do script ou uma gravação em segundo plano)"""
+        return self._executar(rotulo) if self.ativo else _NULO
+
+    def span(self, nome):
+        """Mede um trecho: `with PERFIL.span("etapa"): ...`"""
+        return self._medir(nome) if self.ativo else _NULO
+
+    def medir(self, nome=None):
+        """Decorador que mede cada chamada da função como um span"""
+        def decorador(funcao):
+            rotulo = nome or funcao.__name__
+
+            @wraps(funcao)
+            def medida(*args, **kwargs):
+                if not self.ativo:
+                    return funcao(*args, **kwargs)
+                with self._medir(rotulo):
+                    return funcao(*args, **kwargs)
+            return medida
+        return decorador
+
+    def estatisticas(self):
+        """p50/p95 por etapa (somando as chamadas de cada execução), da etapa mais lenta para a mais rápida"""
+        with self._lock:
+            execucoes = list(self._execucoes)
+        amostras = {}
+        for ex in execucoes:
+            amostras.setdefault(f"[{ex['rotulo']}]", []).append((ex['total_ms'], ex['blocos'], 1))
+            for nome, m in ex['etapas'].items():
+                amostras.setdefault(nome, []).append((m['ms'], m['blocos'], m['chamadas']))
+        linhas = []
+        for nome, valores in amostras.items():
+            ms = [v[0] for v in valores]
+            blocos = [v[1] for v in valores]
+            linhas.append({
+                'etapa': nome, 'execucoes': len(valores), 'chamadas': sum(v[2] for v in valores),
+                'p50_ms': _percentil(ms, 50), 'p95_ms': _percentil(ms, 95), 'max_ms': max(ms),
+                'p50_blocos': _percentil(blocos, 50), 'p95_blocos': _percentil(blocos, 95),
+            })
+        return sorted(linhas, key=lambda l: l['p95_ms'], reverse=True)
+
+    def exportar(self):
+        """Resumo serializável em JSON (estatísticas e execuções brutas)"""
+        with self._lock:
+            execucoes = list(self._execucoes)
+            max_execucoes = self._execucoes.maxlen
+        return {
+            'desde': self.inicio.isoformat(timespec='seconds'),
+            'ativo': self.ativo,
+            'max_execucoes': max_execucoes,
+            'estatisticas': self.estatisticas(),
+            'execucoes': execucoes,
+        }
+
+    def exportar_json(self):
+        return json.dumps(self.exportar(), ensure_ascii=False, indent=2, default=str)
+
+    def limpar(self):
+        with self._lock:
+            self._execucoes.clear()
+            self.inicio = datetime.now()
+
+PERFIL = Perfilador(
+    ativo=os.getenv("OKR_PROFILING", "0") == "1",
+    max_execucoes=int(os.getenv("OKR_PROFILING_EXECUCOES", "200")),
+)
@@ -0,0 +1,38 @@
+"""Os testes rodam contra um SQLite temporário (o app lê DATABASE_URL ao ser importado)."""
+import os
+import sys
+import tempfile
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_BANCO = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+_BANCO.close()
+os.environ["DATABASE_URL"] = f"sqlite:///{_BANCO.name}"
+os.environ["OKR_AUTO_MIGRAR"] = "1"
+
+def pytest_sessionfinish(session, exitstatus):
+    if "app" in sys.modules:
+        sys.modules["app"].engine.dispose()
+    os.unlink(_BANCO.name)
+
+@pytest.fixture(scope="session")
+def app():
+    import app as modulo
+    return modulo
+
+@pytest.fixture
+def sessao(app):
+    """st.session_state limpo, como numa sessão recém-logada"""
+    import streamlit as st
+
+    st.session_state.clear()
+    st.session_state.df_master = pd.DataFrame()
+    st.session_state.df_snapshot = None
+    st.session_state.df_versao = 0
+    st.session_state.needs_save = False
+    st.session_state.user = {'name': "Teste", 'username': "teste"}
+    yield st.session_state
+    st.session_state.clear()
@@ -0,0 +1,73 @@
+from datetime import date, timedelta
+
+import pandas as pd
+import pytest
+
+from database import OKRS
+
+CLIENTE = "teste_dashboard"
+
+def _linhas():
+    hoje = date.today()
+    prazos = [None, hoje - timedelta(days=1), hoje, hoje + timedelta(days=7), hoje + timedelta(days=8),
+              hoje + timedelta(days=30), hoje + timedelta(days=31)]
+    linhas = []
+    for i, (prazo, kr, status) in enumerate(
+        (p, k, s)
+        for p in prazos
+        for k in [None, '', "KR 1"]
+        for s in ["Não Iniciado", "Em Andamento", "Concluído"]
+    ):
+        alvo = float(i % 4 + 1)
+        avanco = float(i % 5)
+        linhas.append({
+            'departamento': f"Depto {i % 3}", 'objetivo': f"Objetivo {i % 2}", 'kr': kr, 'tarefa': f"Tarefa {i}",
+            'status': status, 'responsavel': "Teste", 'prazo': prazo, 'avanco': avanco, 'alvo': alvo,
+            'progresso_pct': min(avanco / alvo, 1.0), 'cliente': CLIENTE,
+        })
+    return linhas
+
+@pytest.fixture(scope="module")
+def agregados(app):
+    with app.engine.begin() as conn:
+        conn.execute(OKRS.delete().where(OKRS.c.cliente == CLIENTE))
+        conn.execute(OKRS.insert(), _linhas())
+    hoje = date.today()
+    banco = app.carregar_dashboard_agregado.__wrapped__(CLIENTE, hoje)
+    memoria = app.agregar_dashboard_memoria(app.carregar_dados_cliente(CLIENTE))
+    return banco, memoria
+
+def _ordenado(df, chave):
+    return df.sort_values(chave).reset_index(drop=True)
+
+def test_kpis_iguais_no_banco_e_em_memoria(agregados):
+    banco, memoria = agregados
+    assert banco['linhas'] == memoria['linhas'] == len(_linhas())
+    for chave in ['total', 'atrasados', 'concluidos']:
+        assert banco[chave] == memoria[chave], chave
+    assert banco['progresso_medio'] == pytest.approx(memoria['progresso_medio'])
+    # Só linhas com KR entram nos KPIs (kr nulo e '' ficam de fora)
+    assert banco['total'] == len([l for l in _linhas() if l['kr']])
+
+@pytest.mark.parametrize("quebra,chave", [('departamentos', 'departamento'), ('status', 'status'),
+                                          ('prazos', 'classificacao_prazo')])
+def test_quebras_iguais_no_banco_e_em_memoria(agregados, quebra, chave):
+    banco, memoria = agregados
+    pd.testing.assert_frame_equal(_ordenado(banco[quebra], chave), _ordenado(memoria[quebra], chave),
+                                  check_dtype=False)
+
+def test_limites_de_prazo(agregados):
+    banco, _ = agregados
+    prazos = dict(zip(banco['prazos']['classificacao_prazo'], banco['prazos']['qtd']))
+    # Por prazo há 2 KRs abertos (kr nulo/'' não contam): ontem atrasa, hoje e +7 são urgentes,
+    # +8 e +30 pedem atenção, +31 está no prazo
+    assert prazos == {"Concluído": 7, "Sem Prazo": 2, "Atrasado": 2, "Urgente (7 dias)": 4,
+                      "Atenção (30 dias)": 4, "No Prazo": 2}
+
+def test_falha_de_banco_nao_fica_no_cache(app, agregados, monkeypatch):
+    hoje = date.today()
+    monkeypatch.setattr(app, "run_query", lambda *args, **kwargs: None)
+    with pytest.raises(app._FalhaConsulta):
+        app.carregar_dashboard_agregado(CLIENTE, hoje, versao=-1)
+    monkeypatch.undo()
+    assert app.carregar_dashboard_agregado(CLIENTE, hoje, versao=-1)['total'] == agregados[0]['total']
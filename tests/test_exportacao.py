@@ -0,0 +1,28 @@
+import io
+
+import pandas as pd
+import pytest
+from streamlit.runtime.download_data_util import convert_data_to_bytes_and_infer_mime
+
+from benchmarks.gerador import gerar_cliente, popular_banco
+from exportacao import COLUNAS_EXPORTACAO, FORMATOS
+
+CLIENTE = "teste_exportacao"
+
+@pytest.fixture(scope="module")
+def dados(app):
+    popular_banco(app.engine, gerar_cliente(CLIENTE, 2, 2, 2, 3))
+    return app.carregar_dados_cliente(CLIENTE)
+
+@pytest.mark.parametrize("formato", list(FORMATOS))
+@pytest.mark.parametrize("origem", ["banco", "memoria"])
+def test_exportacao_gera_bytes_aceitos_pelo_download(app, dados, formato, origem):
+    conteudo = app.gerar_exportacao(formato, CLIENTE, dados if origem == "memoria" else None)
+    assert isinstance(conteudo, bytes) and conteudo
+    # Mesmo caminho do download_button com callable
+    convert_data_to_bytes_and_infer_mime(conteudo, unsupported_error=TypeError("tipo não suportado"))
+
+def test_exportacao_csv_tem_todas_as_linhas(app, dados):
+    df = pd.read_csv(io.BytesIO(app.gerar_exportacao('csv', CLIENTE)), encoding='utf-8-sig')
+    assert list(df.columns) == COLUNAS_EXPORTACAO
+    assert len(df) == len(dados)
@@ -0,0 +1,83 @@
+from datetime import date
+
+import pytest
+
+from benchmarks.gerador import gerar_cliente, popular_banco
+
+CLIENTE = "teste_rollups"
+
+def _comparar(incremental, completo):
+    for mapa in ['krs', 'objetivos', 'departamentos']:
+        a, b = getattr(incremental, mapa), getattr(completo, mapa)
+        assert a.keys() == b.keys(), mapa
+        for chave in b:
+            soma, *contagens = a[chave]
+            assert soma == pytest.approx(b[chave][0]), (mapa, chave)
+            assert contagens == b[chave][1:], (mapa, chave)
+    assert incremental.total[0] == pytest.approx(completo.total[0])
+    assert incremental.total[1:] == completo.total[1:]
+    assert incremental.por_status == completo.por_status
+    assert incremental.por_prazo == completo.por_prazo
+    assert incremental.linhas == completo.linhas
+
+def test_rollups_incrementais_iguais_a_reconstrucao(app, sessao):
+    popular_banco(app.engine, gerar_cliente(CLIENTE, 2, 3, 2, 4))
+    sessao.user['cliente'] = CLIENTE
+    app.garantir_dados_carregados()
+    app.obter_rollups()
+
+    def conferir():
+        # Nenhuma das mutações deve ter forçado a reconstrução
+        assert sessao.rollups_versao == sessao.df_versao
+        _comparar(sessao.rollups, app.Rollups(sessao.df_master, date.today()))
+
+    indice = app.obter_indice()
+    labels = indice['arvore']["Depto 0"]["Objetivo 0.0"]["KR 0"]
+
+    # Editor: edição de avanço/status/prazo, uma linha nova e uma removida
+    sessao['editor_teste'] = {
+        'edited_rows': {0: {'avanco': 999, 'status': "Concluído"}, 1: {'prazo': "2000-01-01"}},
+        'added_rows': [{'tarefa': "Nova", 'avanco': 1, 'alvo': 2}],
+        'deleted_rows': [2],
+    }
+    app.aplicar_edicoes_kr('editor_teste', labels, "Depto 0", "Objetivo 0.0", "KR 0", CLIENTE)
+    conferir()
+
+    # Renomear KR e objetivo (muda as chaves dos mapas)
+    df = sessao.df_master
+    labels_kr = indice['arvore']["Depto 1"]["Objetivo 1.1"]["KR 1"]
+    antes = df.loc[labels_kr]
+    app.atribuir(df, labels_kr, 'kr', "KR renomeado")
+    app.marcar_alteracao(antes, sessao.df_master.loc[labels_kr])
+    conferir()
+
+    labels_obj = indice['objetivos'][("Depto 1", "Objetivo 1.2")]
+    antes = sessao.df_master.loc[labels_obj]
+    app.atribuir(sessao.df_master, labels_obj, 'objetivo', "Objetivo renomeado")
+    app.marcar_alteracao(antes, sessao.df_master.loc[labels_obj])
+    conferir()
+
+    # Novo objetivo (sem KR: não entra nos mapas) e novo KR
+    novas = app.anexar_linhas([
+        {'departamento': "Depto 2", 'objetivo': "Objetivo novo", 'kr': '', 'tarefa': "Tarefa Inicial",
+         'status': "Não Iniciado", 'avanco': 0.0, 'alvo': 1.0, 'progresso_pct': 0.0, 'prazo': date.today(),
+         'responsavel': "Teste", 'cliente': CLIENTE},
+        {'departamento': "Depto 2", 'objetivo': "Objetivo novo", 'kr': "Novo KR", 'tarefa': "Tarefa 1",
+         'status': "Em Andamento", 'avanco': 3.0, 'alvo': 4.0, 'progresso_pct': 0.75, 'prazo': None,
+         'responsavel': "Teste", 'cliente': CLIENTE},
+    ])
+    app.marcar_alteracao(depois=sessao.df_master.loc[novas])
+    conferir()
+
+    # Excluir KR e objetivo inteiros
+    labels_kr = indice['arvore']["Depto 0"]["Objetivo 0.1"]["KR 1"]
+    antes = sessao.df_master.loc[labels_kr]
+    sessao.df_master = sessao.df_master.drop(labels_kr)
+    app.marcar_alteracao(antes=antes)
+    conferir()
+
+    labels_obj = indice['objetivos'][("Depto 1", "Objetivo 1.0")]
+    antes = sessao.df_master.loc[labels_obj]
+    sessao.df_master = sessao.df_master.drop(labels_obj)
+    app.marcar_alteracao(antes=antes)
+    conferir()
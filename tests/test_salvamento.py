@@ -0,0 +1,96 @@
+import time
+from datetime import date
+
+from sqlalchemy import func, select
+
+from database import OKRS
+
+def _linhas_no_banco(app, cliente):
+    with app.engine.connect() as conn:
+        return conn.execute(select(func.count()).select_from(OKRS).where(OKRS.c.cliente == cliente)).scalar()
+
+def _nova_linha(cliente):
+    return {
+        'departamento': "TI", 'objetivo': "Objetivo", 'kr': '', 'tarefa': "Tarefa Inicial",
+        'status': "Não Iniciado", 'avanco': 0.0, 'alvo': 1.0, 'progresso_pct': 0.0,
+        'prazo': date.today(), 'responsavel': "Teste", 'cliente': cliente,
+    }
+
+def _salvar(app, sessao, cliente):
+    relatorio = app.salvar_dados_batch(sessao.df_master, cliente, snapshot=sessao.df_snapshot)
+    assert relatorio is not None
+    app.aplicar_resultado_save(relatorio)
+    sessao.needs_save = False
+    return relatorio
+
+def test_cliente_novo_nao_duplica_linhas_ao_salvar_de_novo(app, sessao):
+    cliente = "teste_cliente_novo"
+    sessao.user['cliente'] = cliente
+    app.garantir_dados_carregados()
+    colunas = list(sessao.df_master.columns)
+
+    novas = app.anexar_linhas([_nova_linha(cliente)])
+    app.marcar_alteracao(depois=sessao.df_master.loc[novas])
+    assert list(sessao.df_master.columns) == colunas
+
+    assert _salvar(app, sessao, cliente)['inseridos'] == 1
+    assert sessao.df_master['id'].notna().all()
+    assert _salvar(app, sessao, cliente)['inseridos'] == 0
+    assert _salvar(app, sessao, cliente)['inseridos'] == 0
+    assert _linhas_no_banco(app, cliente) == 1
+
+def test_descarregar_tenta_de_novo_gravacao_que_falhou(app, sessao, monkeypatch):
+    cliente = "teste_descarregar"
+    sessao.user['cliente'] = cliente
+    app.garantir_dados_carregados()
+    app.anexar_linhas([_nova_linha(cliente)])
+
+    persistir = app.persistir_diff
+    falhas = [RuntimeError("banco indisponível")]
+
+    def persistir_com_falha(*args):
+        if falhas:
+            raise falhas.pop()
+        return persistir(*args)
+    monkeypatch.setattr(app, "persistir_diff", persistir_com_falha)
+
+    fila = app.FilaAutosave(app.get_cache_clientes(), debounce=60, max_workers=1)
+    fila.enfileirar("s1", cliente, sessao.df_master, 1, sessao.df_snapshot)
+    fila._disparar("s1")
+    while fila.status("s1")['em_voo']:
+        time.sleep(0.01)
+    assert fila.status("s1")['status'] == 'erro'
+
+    estado = fila.descarregar("s1")
+    assert estado['status'] == 'gravado' and not estado['pendente'] and not estado['em_voo']
+    assert _linhas_no_banco(app, cliente) == 1
+
+def test_fila_libera_a_sessao_depois_de_entregar_o_resultado(app, sessao):
+    cliente = "teste_fila_libera"
+    sessao.user['cliente'] = cliente
+    app.garantir_dados_carregados()
+    app.anexar_linhas([_nova_linha(cliente)])
+
+    fila = app.FilaAutosave(app.get_cache_clientes(), debounce=60, max_workers=1)
+    assert fila.status("fantasma")['status'] == 'ocioso'
+    assert "fantasma" not in fila._sessoes
+
+    fila.enfileirar("s1", cliente, sessao.df_master, 1, sessao.df_snapshot)
+    assert fila.descarregar("s1")['status'] == 'gravado'
+    resultados = fila.coletar("s1")
+    assert len(resultados) == 1 and resultados[0]['inseridos'] == 1
+    assert "s1" not in fila._sessoes
+
+def test_fila_expira_sessao_abandonada(app, sessao):
+    cliente = "teste_fila_expira"
+    sessao.user['cliente'] = cliente
+    app.garantir_dados_carregados()
+    app.anexar_linhas([_nova_linha(cliente)])
+
+    fila = app.FilaAutosave(app.get_cache_clientes(), debounce=60, max_workers=1, ttl=0.05)
+    fila.enfileirar("abandonada", cliente, sessao.df_master, 1, sessao.df_snapshot)
+    fila.descarregar("abandonada")
+    time.sleep(0.1)
+    fila.enfileirar("outra", cliente, sessao.df_master, 1, sessao.df_snapshot)
+    assert "abandonada" not in fila._sessoes
+    fila.remover("outra")